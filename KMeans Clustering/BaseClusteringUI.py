@@ -1,13 +1,27 @@
+import queue
+import threading
 import tkinter as tk
 from tkinter import ttk
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from FileReader import XYCoordinateExtractor
+from DesignCache import design_key, load_design
+from ResultCache import ResultCache
+from KMeansClusteringHelper import FitCancelled
+from ClusterExport import cluster_report_path, write_cluster_report
 import os
 
+# How often (ms) the Tk thread collects progress and results from the background fit
+FIT_POLL_MS = 50
+
+# Above this many sinks the clusters are drawn as a density image instead of one marker per sink,
+# which keeps a redraw well under 100 ms however large the design is
+PLOT_DENSITY_THRESHOLD = 2000
+# Size of one density image cell, in screen pixels
+DENSITY_CELL_PIXELS = 2
+
 class BaseClusteringUI:
-    def __init__(self, root, title="Clustering UI", mode="regular"):
+    def __init__(self, root, title="Clustering UI", mode="regular", result_cache=None):
         self.root = root
         self.root.title(title)
         self.mode = mode
@@ -16,16 +30,21 @@ class BaseClusteringUI:
         self.output_dir = os.path.join("output", f"{mode}_kmeans")
         os.makedirs(self.output_dir, exist_ok=True)
         
-        # Load data
-        self.extractor = XYCoordinateExtractor(
-            os.path.join("input", "data.txt"),
-            os.path.join("input", "capacitenceData.txt")
-        )
-        raw_points = self.extractor.extract_coordinates()
-        # Convert list of dictionaries to numpy array of coordinates
-        self.points = np.array([[point['x'], point['y']] for point in raw_points])
-        self.labels = [point['label'] for point in raw_points]
-        self.capacitances = [point['capacitance'] for point in raw_points]
+        # Load data (memory-mapped from the parsed-design cache when the input files are unchanged)
+        self.coord_file = os.path.join("input", "data.txt")
+        self.cap_file = os.path.join("input", "capacitenceData.txt")
+        self.sinks = load_design(self.coord_file, self.cap_file, mmap_mode='r')
+        # The columns are used directly, without copying them
+        self.points = self.sinks.points
+        self.labels = self.sinks.labels
+        self.capacitances = self.sinks.capacitances
+        
+        # Fit results, possibly shared with the other windows; keyed by the contents of the inputs
+        self.result_cache = result_cache if result_cache is not None else ResultCache()
+        self.dataset = design_key(self.coord_file, self.cap_file)
+        self.dataset_inputs = (os.path.abspath(self.coord_file), os.path.abspath(self.cap_file))
+        self.result_cache.evict_stale(self.dataset, self.dataset_inputs)
+        self.random_state = 42
         
         # Create main frame
         self.main_frame = ttk.Frame(root, padding="10")
@@ -42,8 +61,17 @@ class BaseClusteringUI:
         
         # Store current clustering results
         self.current_labels = None
+        self.current_centroids = None
         self.current_k = None
         
+        # Fits run on a background thread; only the latest generation's messages are shown
+        self.fit_generation = 0
+        self.fit_events = queue.Queue()
+        self.fit_polling = False
+        self.fit_running = False
+        self.fit_poll_id = None  # Pending root.after call of _poll_fit
+        self.root.bind("<Destroy>", self._on_destroy, add="+")
+        
         # Initial plot
         self.update_plot()
 
@@ -54,7 +82,7 @@ class BaseClusteringUI:
         
         # K value control
         ttk.Label(controls_frame, text="K Value:").grid(row=0, column=0, sticky=tk.W, pady=2)
-        self.k_value = ttk.Spinbox(controls_frame, from_=2, to=20, width=5)
+        self.k_value = ttk.Spinbox(controls_frame, from_=2, to=500, width=5)
         self.k_value.set(3)
         self.k_value.grid(row=0, column=1, sticky=tk.W, pady=2)
         
@@ -65,12 +93,28 @@ class BaseClusteringUI:
         # Save clusters button
         self.save_btn = ttk.Button(controls_frame, text="Save Clusters", command=self.save_clusters)
         self.save_btn.grid(row=2, column=0, columnspan=2, pady=5)
+        
+        # Fast (mini-batch) mode toggle
+        self.fast_mode = tk.BooleanVar(value=False)
+        self.fast_check = ttk.Checkbutton(controls_frame, text="Fast (mini-batch)", variable=self.fast_mode)
+        self.fast_check.grid(row=3, column=0, columnspan=2, sticky=tk.W, pady=2)
+        
+        # Progress of the running fit
+        self.status = tk.StringVar(value="")
+        ttk.Label(controls_frame, textvariable=self.status, width=30).grid(row=4, column=0, columnspan=2, sticky=tk.W, pady=2)
 
     def create_plot_area(self):
         # Create figure for plotting
         self.fig, self.ax = plt.subplots(figsize=(8, 6))
+        self.ax.set_xlabel('X')
+        self.ax.set_ylabel('Y')
         self.canvas = FigureCanvasTkAgg(self.fig, master=self.main_frame)
         self.canvas.get_tk_widget().grid(row=0, column=1, rowspan=2, padx=10, pady=5)
+        
+        # Created by the first result; later results only recolour them instead of redrawing the axes
+        self.points_artist = None  # Scatter of the sinks, or their density image on large designs
+        self.centroid_artist = None
+        self.density_layout = None  # Image cell of every sink and sinks per cell, see density_cells()
 
     def create_centroid_display(self):
         # Create frame for centroid display
@@ -86,42 +130,206 @@ class BaseClusteringUI:
         scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
         self.centroid_text.configure(yscrollcommand=scrollbar.set)
 
+    def fit_algorithm(self):
+        """Algorithm for the clustering classes, following the fast mode toggle
+
+        Full-batch fits use Hamerly's bounds, which give the same clusters as plain Lloyd while
+        skipping most distance computations, so large K stays interactive.
+        """
+        return 'minibatch' if self.fast_mode.get() else 'hamerly'
+
+    def fit_params(self):
+        """Read the fit settings from the widgets (on the Tk thread); must include 'k', 'algorithm' and 'seed'"""
+        return {"k": int(self.k_value.get()), "algorithm": self.fit_algorithm(), "seed": self.random_state}
+
+    def run_fit(self, params, callback):
+        """Fit the model on the worker thread; returns (labels, centroids)"""
+        raise NotImplementedError("Subclasses must implement run_fit")
+
+    def plot_title(self, params):
+        raise NotImplementedError("Subclasses must implement plot_title")
+
+    def describe_params(self, params):
+        """Header of the centroid display"""
+        return f"K = {params['k']}\n\n"
+
+    def result_key(self, params):
+        return ResultCache.key(self.dataset, self.mode, params['algorithm'], params['k'],
+                               params.get('neighborhood_size'), params['seed'])
+
     def update_plot(self):
-        raise NotImplementedError("Subclasses must implement update_plot")
+        """Show the result for the current settings, fitting it on a background thread (and cancelling
+        any running fit) unless it is cached"""
+        try:
+            params = self.fit_params()
+        except ValueError as e:
+            print(f"Error: {e}")
+            return
+        
+        self.fit_generation += 1
+        key = self.result_key(params)
+        cached = self.result_cache.get(key)
+        if cached is not None:
+            self.fit_running = False
+            self.status.set("Loaded from cache")
+            self.show_result(params, *cached)
+            return
+        
+        self.fit_running = True
+        self.status.set(f"Fitting K={params['k']}...")
+        worker = threading.Thread(target=self._fit_worker, args=(self.fit_generation, params, key), daemon=True)
+        worker.start()
+        if not self.fit_polling:
+            self.fit_polling = True
+            self.fit_poll_id = self.root.after(FIT_POLL_MS, self._poll_fit)
+
+    def _fit_worker(self, generation, params, key):
+        def progress(iteration, shift, inertia):
+            # A newer fit has started: abandon this one at the next iteration
+            if generation != self.fit_generation:
+                raise FitCancelled()
+            self.fit_events.put((generation, "progress", (iteration, shift, inertia)))
+        
+        try:
+            labels, centroids = self.run_fit(params, progress)
+            self.result_cache.put(key, labels, centroids, self.dataset_inputs)
+            self.fit_events.put((generation, "result", (params, labels, centroids)))
+        except FitCancelled:
+            pass
+        except Exception as e:
+            self.fit_events.put((generation, "error", e))
+
+    def _on_destroy(self, event):
+        # Children's Destroy events reach this binding too; only the window itself matters
+        if event.widget is not self.root:
+            return
+        # Cancel the running fit and stop polling, so nothing draws into the destroyed widgets
+        self.fit_generation += 1
+        self.fit_running = self.fit_polling = False
+        if self.fit_poll_id is not None:
+            self.root.after_cancel(self.fit_poll_id)
+            self.fit_poll_id = None
+
+    def _poll_fit(self):
+        # Tk is not thread safe, so the worker only queues messages and the Tk thread applies them
+        self.fit_poll_id = None
+        if not self.fit_running:
+            self.fit_polling = False
+            return
+        latest_progress, result = None, None
+        while True:
+            try:
+                generation, kind, payload = self.fit_events.get_nowait()
+            except queue.Empty:
+                break
+            if generation != self.fit_generation:
+                continue
+            if kind == "progress":
+                latest_progress = payload
+            else:
+                result = (kind, payload)
+        
+        if result is not None:
+            self.fit_polling = self.fit_running = False
+            kind, payload = result
+            if kind == "error":
+                self.status.set(f"Error: {payload}")
+                print(f"Error: {payload}")
+            else:
+                self.status.set("")
+                self.show_result(*payload)
+            return
+        if latest_progress is not None:
+            iteration, shift, inertia = latest_progress
+            self.status.set(f"Iteration {iteration}: shift {shift:.4g}, inertia {inertia:.6g}")
+        self.fit_poll_id = self.root.after(FIT_POLL_MS, self._poll_fit)
+
+    def show_result(self, params, labels, centroids):
+        """Draw a finished fit and list its centroids"""
+        k = params['k']
+        self.current_k = k
+        self.current_labels = labels
+        self.current_centroids = centroids
+        
+        self.draw_clusters(labels, centroids)
+        
+        # Update centroid display
+        self.centroid_text.delete(1.0, tk.END)
+        self.centroid_text.insert(tk.END, self.describe_params(params))
+        for i, centroid in enumerate(centroids):
+            self.centroid_text.insert(tk.END, f"Centroid {i+1}:\n")
+            self.centroid_text.insert(tk.END, f"X: {centroid[0]:.4f}\n")
+            self.centroid_text.insert(tk.END, f"Y: {centroid[1]:.4f}\n\n")
+        
+        self.ax.set_title(self.plot_title(params))
+        
+        # Redraw once Tk is idle rather than blocking here
+        self.canvas.draw_idle()
+
+    def draw_clusters(self, labels, centroids):
+        """Colour the sinks by cluster and move the centroid markers
+
+        The artists are created on the first call; after that only the colours of the existing
+        scatter (or the pixels of the density image) and the centroid offsets change.
+        """
+        # Same colours as a fresh scatter, which scales the labels to their own range
+        vmin, vmax = int(np.min(labels)), int(np.max(labels))
+        if self.points.shape[0] > PLOT_DENSITY_THRESHOLD:
+            self.draw_density(labels, vmin, vmax)
+        else:
+            if self.points_artist is None:
+                self.points_artist = self.ax.scatter(self.points[:, 0], self.points[:, 1],
+                                                     c=labels, cmap='rainbow', alpha=0.5)
+            else:
+                self.points_artist.set_array(labels)
+            self.points_artist.set_clim(vmin, vmax)
+        
+        if self.centroid_artist is None:
+            self.centroid_artist = self.ax.scatter(centroids[:, 0], centroids[:, 1],
+                                                   c='black', marker='x', s=200, label='Centroids')
+            self.ax.legend()
+        else:
+            self.centroid_artist.set_offsets(centroids)
+
+    def density_cells(self):
+        """Image cell of every sink and the sinks per cell, for a grid matching the axes on screen"""
+        if self.density_layout is None:
+            bbox = self.ax.get_window_extent()
+            width = max(int(bbox.width // DENSITY_CELL_PIXELS), 1)
+            height = max(int(bbox.height // DENSITY_CELL_PIXELS), 1)
+            low, high = self.points.min(axis=0), self.points.max(axis=0)
+            span = np.where(high > low, high - low, 1.0)
+            columns = np.minimum(((self.points[:, 0] - low[0]) * (width / span[0])).astype(np.intp), width - 1)
+            rows = np.minimum(((self.points[:, 1] - low[1]) * (height / span[1])).astype(np.intp), height - 1)
+            cells = rows * width + columns
+            counts = np.bincount(cells, minlength=width * height)
+            self.density_layout = (cells, counts, (height, width), (low[0], high[0], low[1], high[1]))
+        return self.density_layout
+
+    def draw_density(self, labels, vmin, vmax):
+        """Draw the sinks as an image: each cell has the colour of its last sink (the one a scatter
+        would draw on top) and the opacity of that many markers at alpha 0.5"""
+        cells, counts, shape, extent = self.density_cells()
+        cell_labels = np.zeros(counts.size)
+        cell_labels[cells] = labels  # Repeated cells keep the last sink's label
+        image = plt.colormaps['rainbow']((cell_labels - vmin) / max(vmax - vmin, 1))
+        image[:, 3] = 1.0 - 0.5 ** counts
+        image = image.reshape(shape + (4,))
+        if self.points_artist is None:
+            self.points_artist = self.ax.imshow(image, extent=extent, origin='lower', aspect='auto',
+                                                interpolation='nearest')
+        else:
+            self.points_artist.set_data(image)
 
     def save_clusters(self):
         if self.current_labels is None:
             return
             
         k = self.current_k
-        filename = os.path.join(self.output_dir, f"ClusterOutputk={k}.txt")
+        filename = cluster_report_path(self.output_dir, k)
         
         try:
-            with open(filename, 'w') as f:
-                f.write(f"Cluster Assignments for {self.mode.title()} K-Means (K={k})\n")
-                f.write("=" * 50 + "\n\n")
-                
-                # Group labels by cluster
-                clusters = {}
-                for label, cluster_id, point, cap in zip(self.labels, self.current_labels, self.points, self.capacitances):
-                    if cluster_id not in clusters:
-                        clusters[cluster_id] = []
-                    clusters[cluster_id].append((label, point, cap))
-                
-                # Get the current centroids from the plot
-                centroids = self.ax.collections[-1].get_offsets()
-                
-                # Write each cluster's contents
-                for cluster_id in sorted(clusters.keys()):
-                    f.write(f"Cluster {cluster_id + 1}:\n")
-                    f.write("-" * 20 + "\n")
-                    f.write(f"Centroid Coordinates: X = {centroids[cluster_id][0]:.4f}, Y = {centroids[cluster_id][1]:.4f}\n")
-                    f.write("-" * 20 + "\n")
-                    f.write("Points in this cluster:\n")
-                    for label, point, cap in sorted(clusters[cluster_id]):
-                        f.write(f"{label}: X = {point[0]:.4f}, Y = {point[1]:.4f}, cap = {cap:.5e}\n")
-                    f.write("\n")
-                    
+            write_cluster_report(filename, self.mode, k, self.current_labels, self.sinks, self.current_centroids)
             print(f"Successfully saved cluster assignments to {filename}")
         except Exception as e:
             print(f"Error saving clusters: {e}") 
\ No newline at end of file
@@ -0,0 +1,297 @@
+from functools import partial
+import numpy as np
+from KMeansClusteringHelper import (DEFAULT_BLOCK_BYTES, CentroidModel, _squared_distance_matrix, as_points,
+                                    best_of_restarts, block_rows, centroids_from_sums, inertia, init_centroids,
+                                    label_buffer)
+from WeightedKMeansClustering import normalize_weights
+
+# Nearest clusters each sink may bid for in the auction
+DEFAULT_CANDIDATES = 8
+
+# Price rounds per assignment step before the remaining overflow is repaired greedily
+DEFAULT_AUCTION_ROUNDS = 20
+
+# The auction stops early once a round reduces the overflowing sinks by less than this fraction
+AUCTION_MIN_PROGRESS = 0.05
+
+
+def nearest_candidates(data_points, centroids, n_candidates=DEFAULT_CANDIDATES, block_bytes=DEFAULT_BLOCK_BYTES):
+    """Indices of, and squared distances to, the n_candidates nearest centroids of every point, nearest first"""
+    n_points = data_points.shape[0]
+    n_candidates = min(n_candidates, centroids.shape[0])
+    candidates = np.empty((n_points, n_candidates), dtype=np.intp)
+    distances = np.empty((n_points, n_candidates), dtype=np.float64)
+    centroids = np.asarray(centroids, dtype=data_points.dtype)
+    rows = block_rows(centroids.shape[0], centroids.shape[1], data_points.itemsize, block_bytes)
+    for start in range(0, n_points, rows):
+        block_distances = _squared_distance_matrix(data_points[start:start + rows], centroids)
+        if n_candidates < centroids.shape[0]:
+            nearest = np.argpartition(block_distances, n_candidates - 1, axis=1)[:, :n_candidates]
+        else:
+            nearest = np.broadcast_to(np.arange(n_candidates), block_distances.shape)
+        nearest_distances = np.take_along_axis(block_distances, nearest, axis=1)
+        order = np.argsort(nearest_distances, axis=1)
+        candidates[start:start + rows] = np.take_along_axis(nearest, order, axis=1)
+        distances[start:start + rows] = np.take_along_axis(nearest_distances, order, axis=1)
+    return candidates, distances
+
+
+def _overflow(labels, regret, capacitances, k, max_sinks, max_capacitance):
+    """Mask of the sinks each over-full cluster has to give up: the ones least attached to it
+
+    Within a cluster the sinks are kept in decreasing order of regret (how much more their next
+    best cluster costs) for as long as both limits hold; the rest overflow.
+    """
+    full = np.zeros(k, dtype=bool)
+    if max_sinks is not None:
+        full |= np.bincount(labels, minlength=k) > max_sinks
+    if max_capacitance is not None:
+        full |= np.bincount(labels, weights=capacitances, minlength=k) > max_capacitance
+    overflow = np.zeros(labels.size, dtype=bool)
+    if not np.any(full):
+        return overflow
+
+    # Only the members of over-full clusters need ranking
+    members = np.flatnonzero(full[labels])
+    by_regret = members[np.argsort(-regret[members])]
+    order = by_regret[np.argsort(labels[by_regret], kind='stable')]
+    sorted_labels = labels[order]
+    starts = np.searchsorted(sorted_labels, np.arange(k))
+    keep = np.ones(order.size, dtype=bool)
+    if max_sinks is not None:
+        keep &= np.arange(order.size) - starts[sorted_labels] < max_sinks
+    if max_capacitance is not None:
+        load = np.cumsum(capacitances[order])
+        load -= np.concatenate([[0.0], load])[starts][sorted_labels]
+        keep &= load <= max_capacitance
+    overflow[order] = ~keep
+    return overflow
+
+
+def capacitated_assignment(data_points, weights, capacitances, centroids, max_sinks=None, max_capacitance=None,
+                           n_candidates=DEFAULT_CANDIDATES, max_rounds=DEFAULT_AUCTION_ROUNDS,
+                           block_bytes=DEFAULT_BLOCK_BYTES):
+    """Assign every point to a centroid so that no cluster exceeds max_sinks points or max_capacitance
+
+    Minimizes the weighted squared distance like the unconstrained step, over each point's
+    n_candidates nearest centroids only. Every cluster has a price added to the cost of joining
+    it; each round the points pick their cheapest candidate and every over-full cluster raises
+    its price just past the regret of the marginal point it has to give up (an auction), which
+    sends its least attached points to their next best cluster. Whatever still overflows after
+    max_rounds is moved to the cheapest candidate with room left, all at once in bidding rounds
+    (see _place), and then to the nearest clusters with room. Returns (labels, prices).
+    """
+    k = centroids.shape[0]
+    candidates, distances = nearest_candidates(data_points, centroids, n_candidates, block_bytes)
+    costs = distances * weights[:, np.newaxis]
+    rows = np.arange(data_points.shape[0])
+    prices = np.zeros(k)
+    # Breaks ties between equally attached points and makes every raise move at least one of them
+    epsilon = 1e-6 * max(float(np.mean(costs[:, 0])), np.finfo(np.float64).tiny)
+
+    n_overflow = np.inf
+    for n_round in range(max_rounds + 1):
+        bids = costs + prices[candidates]
+        choice = np.argmin(bids, axis=1)
+        labels = candidates[rows, choice]
+        if candidates.shape[1] > 1:
+            best = bids[rows, choice]
+            bids[rows, choice] = np.inf
+            regret = np.min(bids, axis=1) - best
+        else:
+            regret = np.zeros(rows.size)
+
+        overflow = _overflow(labels, regret, capacitances, k, max_sinks, max_capacitance)
+        if not np.any(overflow):
+            return labels, prices
+        # Restricted to their nearest candidates some sinks may have nowhere to go, and then the
+        # overflow levels off; those are left to the repair below
+        previous, n_overflow = n_overflow, np.count_nonzero(overflow)
+        if n_round == max_rounds or n_overflow > (1 - AUCTION_MIN_PROGRESS) * previous:
+            break
+        raises = np.zeros(k)
+        np.maximum.at(raises, labels[overflow], regret[overflow])
+        raised = np.bincount(labels[overflow], minlength=k) > 0
+        prices[raised] += raises[raised] + epsilon
+
+    # Repair what the auction left over, on all the overflowing sinks at once
+    keep = ~overflow
+    counts = np.bincount(labels[keep], minlength=k)
+    loads = np.bincount(labels[keep], weights=capacitances[keep], minlength=k)
+    pending = np.flatnonzero(overflow)
+    pending = _place(labels, pending, candidates[pending], costs[pending] + prices[candidates[pending]],
+                     capacitances, counts, loads, max_sinks, max_capacitance)
+    while pending.size:
+        # None of their candidates has room left, so offer them the nearest clusters that do
+        room = _room(np.arange(k), capacitances[pending].min(), counts, loads, max_sinks, max_capacitance)
+        if not np.any(room):
+            break
+        open_clusters = np.flatnonzero(room)
+        nearest, nearest_distances = nearest_candidates(data_points[pending], centroids[open_clusters],
+                                                        n_candidates, block_bytes)
+        nearest = open_clusters[nearest]
+        left = _place(labels, pending, nearest, nearest_distances * weights[pending, np.newaxis] + prices[nearest],
+                      capacitances, counts, loads, max_sinks, max_capacitance)
+        if left.size == pending.size:
+            break
+        pending = left
+    if pending.size:
+        print(f"Warning: No cluster had room for {pending.size} sinks. Leaving them in over-full clusters.")
+    return labels, prices
+
+
+def _room(clusters, capacitance, counts, loads, max_sinks, max_capacitance):
+    """Whether each of the clusters can still take a sink of the given capacitance (element-wise)"""
+    room = np.ones(np.shape(clusters), dtype=bool)
+    if max_sinks is not None:
+        room &= counts[clusters] < max_sinks
+    if max_capacitance is not None:
+        room &= loads[clusters] + capacitance <= max_capacitance
+    return room
+
+
+def _place(labels, pending, candidates, bids, capacitances, counts, loads, max_sinks, max_capacitance):
+    """Move the pending sinks to the cheapest of their candidates with room; returns the ones that found none
+
+    Rounds of: every sink bids for its cheapest open candidate, and every cluster takes its
+    lowest bidders up to the room it has left. A cluster's first bidder always fits, so each
+    round places at least one sink per contested cluster. counts and loads are updated.
+    """
+    blocked = ~_room(candidates, capacitances[pending, np.newaxis], counts, loads, max_sinks, max_capacitance)
+    while pending.size:
+        bids = np.where(blocked, np.inf, bids)
+        choice = np.argmin(bids, axis=1)
+        rows = np.arange(pending.size)
+        bidding = np.isfinite(bids[rows, choice])
+        if not np.any(bidding):
+            break
+        targets = candidates[rows, choice]
+
+        # Lowest bidders first within each cluster, ranked like _overflow ranks the members
+        order = np.flatnonzero(bidding)
+        order = order[np.argsort(bids[order, choice[order]], kind='stable')]
+        order = order[np.argsort(targets[order], kind='stable')]
+        sorted_targets = targets[order]
+        starts = np.searchsorted(sorted_targets, sorted_targets)
+        accept = np.ones(order.size, dtype=bool)
+        if max_sinks is not None:
+            accept &= np.arange(order.size) - starts < max_sinks - counts[sorted_targets]
+        if max_capacitance is not None:
+            load = np.cumsum(capacitances[pending[order]])
+            load -= np.concatenate([[0.0], load])[starts]
+            accept &= loads[sorted_targets] + load <= max_capacitance
+        accepted = order[accept]
+        labels[pending[accepted]] = targets[accepted]
+        np.add.at(counts, targets[accepted], 1)
+        np.add.at(loads, targets[accepted], capacitances[pending[accepted]])
+
+        left = np.ones(pending.size, dtype=bool)
+        left[accepted] = False
+        pending, candidates, bids, blocked = pending[left], candidates[left], bids[left], blocked[left]
+        blocked |= ~_room(candidates, capacitances[pending, np.newaxis], counts, loads, max_sinks, max_capacitance)
+    return pending
+
+
+def capacitated_restart(data_points, weights, capacitances, k, init='uniform', max_iterations=100, max_sinks=None,
+                        max_capacitance=None, n_candidates=DEFAULT_CANDIDATES, max_rounds=DEFAULT_AUCTION_ROUNDS,
+                        tol=1e-3, block_bytes=DEFAULT_BLOCK_BYTES, rng=np.random, out=None, callback=None):
+    """One capacitated fit: seeding, then capacitated assignments alternating with weighted mean updates
+
+    Stops once no label changes or the inertia drops by less than tol (relative); the limits can
+    keep a few sinks trading places between neighbouring clusters indefinitely, so the labels
+    alone may never settle. callback(iteration, shift, inertia) is called after every
+    iteration. Returns (labels, centroids, n_iterations, inertia), like fit_restart.
+    """
+    centroids = np.array(init_centroids(init, data_points, k, weights, rng, block_bytes), dtype=np.float64)
+    labels = label_buffer(data_points.shape[0], out)
+    labels[:] = -1
+    cost = np.inf
+
+    n_iterations = 0
+    for n_iterations in range(1, max_iterations + 1):
+        new_labels, _ = capacitated_assignment(data_points, weights, capacitances, centroids, max_sinks,
+                                               max_capacitance, n_candidates, max_rounds, block_bytes)
+        n_changed = np.count_nonzero(new_labels != labels)
+        labels[:] = new_labels
+
+        sums = np.zeros_like(centroids)
+        weight_sums = np.bincount(labels, weights=weights, minlength=k)
+        for j in range(data_points.shape[1]):
+            sums[:, j] = np.bincount(labels, weights=data_points[:, j] * weights, minlength=k)
+        new_centroids = centroids_from_sums(sums, weight_sums, centroids)
+        shift = float(np.sqrt(np.max(np.sum((new_centroids - centroids) ** 2, axis=1))))
+        centroids = new_centroids
+        previous_cost, cost = cost, inertia(data_points, centroids, labels, weights, block_bytes)
+        if callback is not None:
+            callback(n_iterations, shift, cost)
+
+        # Check for convergence
+        if n_changed == 0 or previous_cost - cost < tol * cost:
+            break
+
+    return labels, centroids, n_iterations, cost
+
+
+class CapacitatedKMeansClustering(CentroidModel):
+    """Weighted K-means where every cluster stays under a sink count and a summed capacitance limit
+
+    For clock-tree synthesis, where one buffer drives each cluster and has a fanout and a load
+    limit. The limits are in the units given to set_weights (the capacitances from
+    XYCoordinateExtractor); either may be None. The assignment step is an auction over each
+    sink's nearest clusters, see capacitated_assignment.
+    """
+
+    def __init__(self, k=3, max_iterations=100, random_state=42, block_bytes=DEFAULT_BLOCK_BYTES, dtype=np.float64,
+                 init='uniform', n_init=1, n_jobs=1, executor='thread', max_sinks=None, max_capacitance=None,
+                 n_candidates=DEFAULT_CANDIDATES, max_rounds=DEFAULT_AUCTION_ROUNDS, tol=1e-3):
+        super().__init__(k, random_state, block_bytes, dtype, init)
+        self.max_iterations = max_iterations
+        self.weights = None
+        self.capacitances = None  # The capacitances as given, which the limits and loads apply to
+        self.n_init = n_init  # Independent restarts; the one with the lowest weighted inertia is kept
+        self.n_jobs = n_jobs  # Workers running the restarts in parallel
+        self.executor = executor  # 'thread' or 'process' pool for the restarts
+        self.max_sinks = max_sinks  # Most sinks per cluster (fanout limit), or None
+        self.max_capacitance = max_capacitance  # Most summed capacitance per cluster (load limit), or None
+        self.n_candidates = n_candidates  # Nearest clusters each sink may be assigned to
+        self.max_rounds = max_rounds  # Auction rounds per assignment before the greedy repair
+        self.tol = tol  # Stop once an iteration lowers the inertia by less than this fraction
+
+    def set_weights(self, weights):
+        """Set the capacitances to cluster with and to hold to the limits (or a SinkData table)"""
+        self.capacitances = np.array(getattr(weights, 'capacitances', weights), dtype=np.float64)
+        # Clustered with the weights of WeightedKMeansClustering, while the limits count the zeros as zero
+        self.weights, _ = normalize_weights(self.capacitances)
+
+    def check_limits(self, n_points):
+        """Raise ValueError when no assignment of the sinks to k clusters can meet the limits"""
+        if self.max_sinks is not None and self.k * self.max_sinks < n_points:
+            raise ValueError(f"{n_points} sinks do not fit in {self.k} clusters of at most {self.max_sinks}")
+        if self.max_capacitance is not None:
+            if np.max(self.capacitances) > self.max_capacitance:
+                raise ValueError(f"A sink's capacitance {np.max(self.capacitances)} exceeds the cluster limit "
+                                 f"{self.max_capacitance}")
+            if np.sum(self.capacitances) > self.k * self.max_capacitance:
+                raise ValueError(f"Total capacitance {np.sum(self.capacitances)} does not fit in {self.k} clusters "
+                                 f"of at most {self.max_capacitance}")
+
+    def loads(self, labels):
+        """Sink count and summed capacitance of every cluster for the given labels"""
+        return (np.bincount(labels, minlength=self.k),
+                np.bincount(labels, weights=self.capacitances, minlength=self.k))
+
+    def fit(self, data_points, out=None, init=None, callback=None):
+        data_points = as_points(data_points, self.dtype)
+
+        # Ensure weights are set
+        if self.weights is None:
+            raise ValueError("Weights must be set before fitting. Use set_weights() method.")
+        self.check_limits(data_points.shape[0])
+
+        restart = partial(capacitated_restart, data_points, self.weights, self.capacitances, self.k,
+                          init or self.init, self.max_iterations, self.max_sinks, self.max_capacitance,
+                          self.n_candidates, self.max_rounds, self.tol, self.block_bytes, callback=callback)
+        labels, self.centroids, self.n_iterations, self.inertia = best_of_restarts(
+            restart, self.n_init, self.random_state, self.n_jobs, self.executor, out)
+
+        return labels
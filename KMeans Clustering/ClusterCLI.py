@@ -0,0 +1,101 @@
+"""Headless clustering: python -m ClusterCLI --mode weighted -k 8 16 32
+
+Loads the design, fits the chosen model for every K and writes the same reports as the GUI's
+Save Clusters button, without importing Tk or matplotlib (--gui opens the windows instead).
+"""
+import argparse
+import os
+import time
+
+_START = time.perf_counter()
+
+from ClusterExport import EXPORT_FORMATS, export_clusters
+from DesignCache import load_design
+
+MODES = ("regular", "weighted", "entropy")
+
+
+def make_model(mode, k, algorithm='hamerly', init='uniform', seed=42, metric='sqeuclidean'):
+    """The clustering model for a mode; only that mode's module is imported"""
+    if mode == "regular":
+        from KMeansClusteringHelper import KMenasClustering
+        return KMenasClustering(k=k, algorithm=algorithm, init=init, random_state=seed, metric=metric)
+    if mode == "weighted":
+        from WeightedKMeansClustering import WeightedKMeansClustering
+        return WeightedKMeansClustering(k=k, algorithm=algorithm, init=init, random_state=seed, metric=metric)
+    from EntropyKMeansClustering import EntropyKMeansClustering
+    return EntropyKMeansClustering(k=k, algorithm=algorithm, init=init, random_state=seed, metric=metric)
+
+
+def fit(sinks, mode, k, algorithm='hamerly', init='uniform', seed=42, metric='sqeuclidean', neighborhood_size=5):
+    """Fit one K on the sinks; returns the fitted model and its labels"""
+    model = make_model(mode, k, algorithm, init, seed, metric)
+    if mode == "regular":
+        return model, model.fit(sinks.points)
+    model.set_weights(sinks.capacitances)
+    if mode == "weighted":
+        return model, model.fit(sinks.points)
+    return model, model.fit(sinks.points, neighborhood_size=neighborhood_size)
+
+
+def run_gui():
+    # Tk and matplotlib are only imported when the windows are asked for
+    from MainUI import main as gui_main
+    gui_main()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m ClusterCLI",
+                                     description="Cluster the sinks of a design for one or more K without a display")
+    parser.add_argument("--mode", choices=MODES, default="regular")
+    parser.add_argument("-k", type=int, nargs="+", default=[3], help="K values to fit")
+    parser.add_argument("--algorithm", choices=["lloyd", "hamerly", "minibatch"], default="hamerly")
+    parser.add_argument("--init", choices=["uniform", "k-means++", "k-means||"], default="uniform")
+    parser.add_argument("--metric", choices=["sqeuclidean", "euclidean", "manhattan"], default="sqeuclidean")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--neighborhood-size", type=int, default=5, help="Entropy mode neighborhood size")
+    parser.add_argument("--coord", default=os.path.join("input", "data.txt"), help="Coordinate file")
+    parser.add_argument("--cap", default=os.path.join("input", "capacitenceData.txt"), help="Capacitance (SPEF) file")
+    parser.add_argument("--output-dir", help="Where to write the reports (default: output/<mode>_kmeans, like the GUI)")
+    parser.add_argument("--format", nargs="+", choices=list(EXPORT_FORMATS), default=["text"], dest="formats",
+                        help="Report formats to write: the GUI's text report, or CSV, .npz and JSON lines")
+    parser.add_argument("--save-models", action="store_true",
+                        help="Also save every fitted model (model_k=K.npz) for predicting new placements")
+    parser.add_argument("--gui", action="store_true", help="Open the clustering windows instead")
+    args = parser.parse_args(argv)
+
+    if args.gui:
+        run_gui()
+        return
+    if args.metric == "manhattan" and args.algorithm != "lloyd":
+        parser.error("--metric manhattan needs --algorithm lloyd")
+
+    output_dir = args.output_dir or os.path.join("output", f"{args.mode}_kmeans")
+    os.makedirs(output_dir, exist_ok=True)
+    print(f"Started in {time.perf_counter() - _START:.3f} s")
+
+    start_time = time.perf_counter()
+    sinks = load_design(args.coord, args.cap)
+    if args.mode != "regular" and not (sinks.capacitances > 0).any():
+        parser.error(f"the {args.mode} mode needs capacitances, but none were found in {args.cap}")
+    print(f"Loaded {len(sinks)} sinks in {time.perf_counter() - start_time:.3f} s")
+
+    print(f"{'K':>5} {'iterations':>11} {'inertia':>14} {'fit (s)':>9} {'write (s)':>10}")
+    for k in args.k:
+        start_time = time.perf_counter()
+        model, cluster_ids = fit(sinks, args.mode, k, args.algorithm, args.init, args.seed, args.metric,
+                                 args.neighborhood_size)
+        fit_time = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        export_clusters(output_dir, args.mode, k, cluster_ids, sinks, model.centroids, args.formats)
+        if args.save_models:
+            model.save(os.path.join(output_dir, f"model_k={k}.npz"))
+        write_time = time.perf_counter() - start_time
+        print(f"{k:>5} {model.n_iterations:>11} {model.inertia:>14.6g} {fit_time:>9.3f} {write_time:>10.3f}")
+
+    print(f"Wrote {len(args.k)} report(s) to {output_dir} in {time.perf_counter() - _START:.2f} s total")
+
+
+if __name__ == "__main__":
+    main()
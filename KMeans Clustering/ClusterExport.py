@@ -0,0 +1,377 @@
+import json
+import os
+import numpy as np
+
+# Output formats of export_clusters and the extension of each
+EXPORT_FORMATS = {"text": ".txt", "csv": ".csv", "npz": ".npz", "jsonl": ".jsonl"}
+
+# Columns of the CSV and JSON-lines exports, one row per sink in the design's sink order like the
+# .npz export. cluster is the 0-based label of the fit; x, y and the centroid have 6 decimals and the
+# capacitance 10 significant digits. The .npz export has the same fields as exact arrays.
+SCHEMA = ("sink", "numeric_id", "cluster", "x", "y", "capacitance", "centroid_x", "centroid_y")
+
+# Sinks formatted per block, small enough that a block's byte table stays in the CPU cache
+EXPORT_BLOCK_ROWS = 4096
+
+
+def cluster_report_path(output_dir, k, fmt="text"):
+    """Where the export of K clusters in the given format goes"""
+    return os.path.join(output_dir, f"ClusterOutputk={k}{EXPORT_FORMATS[fmt]}")
+
+
+def _label_ranks(label_table):
+    # SinkData's label table comes out of a sort already; anything else is ranked here
+    if label_table.size < 2 or np.all(label_table[:-1] < label_table[1:]):
+        return np.arange(label_table.size)
+    ranks = np.empty(label_table.size, dtype=np.intp)
+    ranks[np.argsort(label_table, kind='stable')] = np.arange(label_table.size)
+    return ranks
+
+
+def cluster_order(sinks, cluster_ids):
+    """Sink indices grouped by cluster, each cluster sorted by sink name, and where every cluster starts
+
+    This is the order the text report has always listed the sinks in. When every sink name is
+    unique the name order is a scatter of the name ranks and a stable sort of the cluster ids
+    keeps it; repeated names need the slower lexsort that also breaks ties by x, y and
+    capacitance. Returns (order, starts) with starts[c]:starts[c + 1] the rows of cluster c.
+    """
+    cluster_ids = np.asarray(cluster_ids, dtype=np.int64)
+    label_table = np.asarray(sinks.label_table)
+    ranks = _label_ranks(label_table)[np.asarray(sinks.label_codes)]
+    n_clusters = int(cluster_ids.max()) + 1 if cluster_ids.size else 0
+    if np.bincount(ranks, minlength=label_table.size).max(initial=0) > 1:
+        points = np.asarray(sinks.points)
+        order = np.lexsort((sinks.capacitances, points[:, 1], points[:, 0], ranks, cluster_ids))
+    else:
+        by_name = np.full(label_table.size, -1, dtype=np.intp)
+        by_name[ranks] = np.arange(ranks.size)
+        by_name = by_name[by_name >= 0]
+        # A stable sort of 16-bit keys is a radix sort
+        keys = np.take(cluster_ids, by_name)
+        order = by_name[np.argsort(keys.astype(np.int16) if n_clusters <= 2 ** 15 else keys, kind='stable')]
+    starts = np.concatenate([[0], np.cumsum(np.bincount(cluster_ids, minlength=n_clusters))])
+    return order, starts
+
+
+# Text is assembled from (rows x width) byte tables: every field is formatted a whole column at a
+# time as pieces padded with NUL bytes, and the padding is dropped from the joined pieces at the end
+
+def _table(strings):
+    """Byte table of an 'S' array"""
+    return strings.view(np.uint8).reshape(strings.size, strings.itemsize)
+
+
+def _digit_table(width, leading_zeros=True):
+    """(10**width x width) byte table of every integer below 10**width, right aligned"""
+    numbers = np.arange(10 ** width)
+    digits = np.empty((numbers.size, width), dtype=np.uint8)
+    remaining = numbers
+    for column in range(width - 1, -1, -1):
+        digits[:, column] = remaining % 10 + ord('0')
+        remaining = remaining // 10
+    if not leading_zeros:
+        places = 10 ** np.arange(width - 1, -1, -1)
+        places[-1] = 0
+        digits[numbers[:, np.newaxis] < places] = 0
+    return digits
+
+
+def _packed(table, itemsize):
+    """The rows of a byte table as unsigned integers of itemsize bytes, each row right aligned in its bytes"""
+    padded = np.zeros((table.shape[0], itemsize), dtype=np.uint8)
+    padded[:, itemsize - table.shape[1]:] = table
+    return padded.view(f'u{itemsize}').ravel()
+
+
+# Lookups index these with whole columns, which is much cheaper for one integer per value than for
+# a row of bytes: the zero-padded digits of every integer below 10**width, by width, the integers
+# below 10**4 without leading zeros, and f"e{exponent:+03d}" for every exponent a float64 can have
+PADDED_DIGITS = {width: _packed(_digit_table(width), itemsize) for width, itemsize in ((1, 1), (2, 2), (3, 4), (4, 4))}
+INTEGERS = _packed(_digit_table(4, leading_zeros=False), 4)
+EXPONENTS = _packed(_table(np.array([f"e{exponent:+03d}" for exponent in range(-400, 401)], dtype='S')), 8)
+SHORT_EXPONENTS = _packed(_table(np.array([f"e{exponent:+03d}" for exponent in range(-99, 100)], dtype='S')), 4)
+with np.errstate(over='ignore', under='ignore'):
+    POWERS_OF_TEN = 10.0 ** np.arange(-400, 401)
+
+
+def _bytes(words):
+    """Byte table of the bytes of every unsigned integer of a column"""
+    return words.view(np.uint8).reshape(words.size, words.itemsize)
+
+
+def _rows(piece, n_rows):
+    """(n_rows x width) byte table of a piece: a table already, or bytes repeated on every row"""
+    if isinstance(piece, bytes):
+        return np.broadcast_to(np.frombuffer(piece, dtype=np.uint8), (n_rows, len(piece)))
+    return piece
+
+
+def _replaced(pieces, rows, texts):
+    """The pieces as one table with the rows in the mask rows replaced by texts"""
+    table = np.concatenate([_rows(piece, rows.size) for piece in pieces], axis=1)
+    exact = _table(np.array(texts, dtype='S'))
+    table = np.pad(table, ((0, 0), (0, max(exact.shape[1] - table.shape[1], 0))))
+    table[rows] = 0
+    table[rows, :exact.shape[1]] = exact
+    return [table]
+
+
+def _digits(values, width):
+    """Pieces of the zero-padded digits of non-negative integers below 10**width"""
+    pieces = []
+    while width > 0:
+        chunk = min(width, 4)
+        high = values // 10 ** chunk
+        pieces.insert(0, _bytes(PADDED_DIGITS[chunk][values - high * 10 ** chunk]))
+        values, width = high, width - chunk
+    return pieces
+
+
+def _integers(values):
+    """Pieces of non-negative integers below 10**12"""
+    high = values // 10 ** 4
+    low = values - high * 10 ** 4
+    if not np.any(high):
+        return [_bytes(INTEGERS[low])]
+    large = high > 0
+    return ([np.where(large[:, np.newaxis], piece, 0) for piece in _integers(high)]
+            + [_bytes(np.where(large, PADDED_DIGITS[4][low], INTEGERS[low]))])
+
+
+def _near_half(scaled):
+    # The exact binary value may round the other way than the rounded product; leave those to Python
+    fraction = scaled - np.floor(scaled)
+    return np.abs(fraction - 0.5) < 1e-9 + scaled * 1e-15
+
+
+def _signed(pieces, values, bad, spec):
+    """The pieces behind a minus for the negative values, with Python's formatting of the bad rows"""
+    negative = np.signbit(values) & ~bad
+    if np.any(negative):
+        pieces = [np.where(negative, ord('-'), 0).astype(np.uint8)[:, np.newaxis]] + pieces
+    if np.any(bad):
+        pieces = _replaced(pieces, bad, [format(float(value), spec) for value in values[bad]])
+    return pieces
+
+
+def _fixed(values, decimals):
+    """Pieces of format(value, f'.{decimals}f') for every value"""
+    values = np.asarray(values, dtype=np.float64)
+    scale = 10 ** decimals
+    with np.errstate(invalid='ignore'):
+        scaled = np.abs(values) * scale
+        bad = ~(scaled < 2.0 ** 52)
+    scaled[bad] = 0.0
+    bad |= _near_half(scaled)
+    rounded = np.rint(scaled).astype(np.int64)
+    whole = rounded // scale
+    pieces = _integers(whole) + [b'.'] + _digits(rounded - whole * scale, decimals)
+    return _signed(pieces, values, bad, f".{decimals}f")
+
+
+def _scientific(values, decimals):
+    """Pieces of format(value, f'.{decimals}e') for every value"""
+    values = np.asarray(values, dtype=np.float64)
+    scale = 10 ** decimals
+    magnitudes = np.abs(values)
+    normal = (magnitudes >= 1e-300) & (magnitudes <= np.finfo(np.float64).max)
+    magnitudes[~normal] = 1.0
+    exponents = np.floor(np.log10(magnitudes)).astype(np.int64)
+    # log10 can be off by one at exact powers of ten
+    mantissas = magnitudes / POWERS_OF_TEN[exponents + 400]
+    exponents += (mantissas >= 10).astype(np.int64) - (mantissas < 1).astype(np.int64)
+    scaled = magnitudes / POWERS_OF_TEN[exponents + 400] * scale
+    bad = ~normal & (values != 0) | _near_half(scaled)
+    rounded = np.rint(scaled).astype(np.int64)
+    # 9.99999...5 rounds up to 10.000...
+    carry = rounded >= 10 * scale
+    rounded[carry] //= 10
+    exponents = np.where(normal, exponents + carry, 0)
+    rounded[~normal] = 0
+    leading = rounded // scale
+    pieces = [_bytes(PADDED_DIGITS[1][leading]), b'.'] + _digits(rounded - leading * scale, decimals)
+    if np.all(np.abs(exponents) < 100):
+        pieces.append(_bytes(SHORT_EXPONENTS[exponents + 99]))
+    else:
+        pieces.append(_bytes(EXPONENTS[exponents + 400]))
+    return _signed(pieces, values, bad, f".{decimals}e")
+
+
+def _encode(strings):
+    """str array as UTF-8 'S' array: a byte narrowing of the code points when they are all ASCII"""
+    strings = np.asarray(strings)
+    width = strings.itemsize // 4
+    if strings.size == 0 or width == 0:
+        return strings.astype('S')
+    code_points = np.ascontiguousarray(strings).view(np.uint32).reshape(strings.size, width)
+    if code_points.max() < 0x80:
+        return code_points.astype(np.uint8).view(f'S{width}').ravel()
+    return np.char.encode(strings, 'utf-8')
+
+
+def _escaped(strings, fmt):
+    """Byte table of a str array ready to go between double quotes in a CSV or JSON file"""
+    encoded = _encode(strings)
+    table = _table(encoded)
+    if fmt == "csv" and np.any(table == ord('"')):
+        encoded = np.char.replace(encoded, b'"', b'""')
+    elif fmt == "jsonl" and np.any((table < 0x20) & (table > 0) | (table == ord('"')) | (table == ord('\\'))):
+        encoded = np.array([json.dumps(value, ensure_ascii=False)[1:-1].encode()
+                            for value in np.asarray(strings).tolist()], dtype='S')
+    return _table(encoded)
+
+
+def _join(pieces, n_rows):
+    """Bytes of the rows of the pieces side by side, one row after another"""
+    widths = [len(piece) if isinstance(piece, bytes) else piece.shape[1] for piece in pieces]
+    ends = np.cumsum(widths)
+    # The text between the formatted fields goes in with one copy of the row it is the same in
+    template = np.zeros(ends[-1], dtype=np.uint8)
+    table = np.empty((n_rows, ends[-1]), dtype=np.uint8)
+    for piece, end, width in zip(pieces, ends, widths):
+        if isinstance(piece, bytes):
+            template[end - width:end] = np.frombuffer(piece, dtype=np.uint8)
+    table[:] = template
+    for piece, end, width in zip(pieces, ends, widths):
+        if not isinstance(piece, bytes):
+            table[:, end - width:end] = piece
+    padding = table.size - np.count_nonzero(table)
+    # Deleting a few NUL bytes is much cheaper than indexing every byte with a mask, but not many
+    if padding * 20 < table.size:
+        return table.tobytes().replace(b"\0", b"")
+    return table[table != 0].tobytes()
+
+
+def write_cluster_report(filename, mode, k, cluster_ids, sinks, centroids):
+    """Write the text report of a clustering: every cluster's centroid followed by its sinks
+
+    sinks is the SinkData that was clustered, cluster_ids its fitted labels and centroids the
+    fitted centroids. The lines are formatted a block of sinks at a time with array operations,
+    exactly as f"{label}: X = {x:.4f}, Y = {y:.4f}, cap = {cap:.5e}" would.
+    """
+    order, starts = cluster_order(sinks, cluster_ids)
+    names = _table(_encode(sinks.label_table))
+
+    def lines(start, stop):
+        rows = order[start:stop]
+        points = np.take(sinks.points, rows, axis=0)
+        return _join([np.take(names, np.take(sinks.label_codes, rows), axis=0), b": X = "] + _fixed(points[:, 0], 4)
+                     + [b", Y = "] + _fixed(points[:, 1], 4) + [b", cap = "]
+                     + _scientific(np.take(sinks.capacitances, rows), 5) + [b"\n"], rows.size)
+
+    with open(filename, 'wb') as f:
+        f.write(f"Cluster Assignments for {mode.title()} K-Means (K={k})\n".encode())
+        f.write(("=" * 50 + "\n\n").encode())
+        block, block_start, offsets = None, 0, np.zeros(1, dtype=np.int64)
+        for cluster_id in range(starts.size - 1):
+            if starts[cluster_id] == starts[cluster_id + 1]:
+                continue
+            f.write(f"Cluster {cluster_id + 1}:\n".encode())
+            f.write(("-" * 20 + "\n").encode())
+            f.write(f"Centroid Coordinates: X = {centroids[cluster_id][0]:.4f}, "
+                    f"Y = {centroids[cluster_id][1]:.4f}\n".encode())
+            f.write(("-" * 20 + "\n").encode())
+            f.write(b"Points in this cluster:\n")
+            # Write the cluster's lines, formatting further blocks of the order as they are reached
+            row, end = int(starts[cluster_id]), int(starts[cluster_id + 1])
+            while row < end:
+                if row >= block_start + offsets.size - 1:
+                    block_start = row
+                    block = lines(row, min(row + EXPORT_BLOCK_ROWS, order.size))
+                    # Sink names never hold a line break, so every line ends at the next one
+                    offsets = np.concatenate([[0], np.flatnonzero(np.frombuffer(block, dtype=np.uint8) == ord('\n')) + 1])
+                    block = memoryview(block)
+                stop = min(end, block_start + offsets.size - 1)
+                f.write(block[offsets[row - block_start]:offsets[stop - block_start]])
+                row = stop
+            f.write(b"\n")
+
+
+# Text before each SCHEMA field, and after the last, in a CSV row and a JSON line
+CSV_RECORD = (b'"', b'","', b'",', b',', b',', b',', b',', b',', b'\n')
+JSONL_RECORD = (b'{"sink": "', b'", "numeric_id": "', b'", "cluster": ', b', "x": ', b', "y": ', b', "capacitance": ',
+                b', "centroid_x": ', b', "centroid_y": ', b'}\n')
+
+
+def _write_records(filename, fmt, cluster_ids, sinks, centroids):
+    """Write one CSV row or JSON line per sink with the SCHEMA fields, in the design's sink order"""
+    cluster_ids = np.asarray(cluster_ids, dtype=np.int64)
+    centroids = np.asarray(centroids, dtype=np.float64)
+    names = _escaped(sinks.label_table, fmt)
+    numeric_ids = _escaped(sinks.numeric_ids, fmt)
+    record = CSV_RECORD if fmt == "csv" else JSONL_RECORD
+
+    def numbers(formatter, values, decimals):
+        pieces = formatter(values, decimals)
+        invalid = ~np.isfinite(values)
+        if fmt == "jsonl" and np.any(invalid):
+            # JSON has no nan or inf
+            pieces = _replaced(pieces, invalid, ["null"] * int(np.count_nonzero(invalid)))
+        return pieces
+
+    # The cluster and centroid fields are formatted once per cluster and gathered like the names
+    n_clusters = centroids.shape[0]
+    clusters = _table(np.array([b"%d" % cluster for cluster in range(n_clusters)], dtype='S'))
+    cluster_centroids = np.concatenate([_rows(piece, n_clusters) for piece in numbers(_fixed, centroids[:, 0], 6)
+                                        + [record[7]] + numbers(_fixed, centroids[:, 1], 6)], axis=1)
+
+    def rows_text(rows):
+        points = np.asarray(sinks.points[rows])
+        labels = cluster_ids[rows]
+        fields = [[np.take(names, sinks.label_codes[rows], axis=0)], [numeric_ids[rows]],
+                  [np.take(clusters, labels, axis=0)], numbers(_fixed, points[:, 0], 6),
+                  numbers(_fixed, points[:, 1], 6), numbers(_scientific, np.asarray(sinks.capacitances[rows]), 9),
+                  [np.take(cluster_centroids, labels, axis=0)]]
+        pieces = [piece for text, field in zip(record, fields) for piece in [text] + field]
+        return _join(pieces + [record[-1]], labels.size)
+
+    with open(filename, 'wb') as f:
+        if fmt == "csv":
+            f.write((",".join(SCHEMA) + "\n").encode())
+        for start in range(0, cluster_ids.size, EXPORT_BLOCK_ROWS):
+            f.write(rows_text(slice(start, start + EXPORT_BLOCK_ROWS)))
+
+
+def write_cluster_csv(filename, cluster_ids, sinks, centroids):
+    """Write one CSV row per sink with the SCHEMA columns (a header row first), in the design's sink order"""
+    _write_records(filename, "csv", cluster_ids, sinks, centroids)
+
+
+def write_cluster_jsonl(filename, cluster_ids, sinks, centroids):
+    """Write one JSON object per line and sink with the SCHEMA keys, in the design's sink order"""
+    _write_records(filename, "jsonl", cluster_ids, sinks, centroids)
+
+
+def write_cluster_npz(filename, mode, k, cluster_ids, sinks, centroids):
+    """Write the clustering as exact arrays in the design's sink order
+
+    Keys: the SCHEMA fields except the per-sink centroid (sink names as label_table and
+    label_codes, like SinkData), plus centroids (K x 2), mode and k.
+    """
+    points = np.asarray(sinks.points, dtype=np.float64)
+    np.savez(filename, label_table=np.asarray(sinks.label_table), label_codes=np.asarray(sinks.label_codes),
+             numeric_id=np.asarray(sinks.numeric_ids), cluster=np.asarray(cluster_ids, dtype=np.int32),
+             x=points[:, 0], y=points[:, 1], capacitance=np.asarray(sinks.capacitances, dtype=np.float64),
+             centroids=np.asarray(centroids, dtype=np.float64), mode=np.array(mode), k=np.array(k))
+
+
+def export_clusters(output_dir, mode, k, cluster_ids, sinks, centroids, formats=("text",)):
+    """Write a clustering in every requested format (see EXPORT_FORMATS); returns the paths written"""
+    for fmt in formats:
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format {fmt!r}; expected one of {', '.join(EXPORT_FORMATS)}")
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for fmt in formats:
+        path = cluster_report_path(output_dir, k, fmt)
+        if fmt == "text":
+            write_cluster_report(path, mode, k, cluster_ids, sinks, centroids)
+        elif fmt == "csv":
+            write_cluster_csv(path, cluster_ids, sinks, centroids)
+        elif fmt == "jsonl":
+            write_cluster_jsonl(path, cluster_ids, sinks, centroids)
+        else:
+            write_cluster_npz(path, mode, k, cluster_ids, sinks, centroids)
+        paths.append(path)
+    return paths
@@ -0,0 +1,201 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+import numpy as np
+from FileReader import SinkData, XYCoordinateExtractor
+
+# Where parsed designs are cached, relative to the working directory like input/ and output/
+DEFAULT_CACHE_DIR = ".design_cache"
+
+# Bump when the cached layout or the parser output changes so old entries are rebuilt
+CACHE_VERSION = 1
+
+# Columns of SinkData, each stored as its own .npy file so it can be memory-mapped
+_COLUMNS = ("points", "capacitances", "label_codes", "label_table", "numeric_ids")
+
+_HASH_CHUNK = 16 * 1024 * 1024
+
+
+def file_hash(path):
+    """BLAKE2b digest of a file's contents, read in chunks"""
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(_HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _file_signature(path, with_hash=True):
+    """Path, size, mtime and (optionally) content hash of an input file; exists=False if it is missing"""
+    path = os.path.abspath(path)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return {"path": path, "exists": False}
+    signature = {"path": path, "exists": True, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    if with_hash:
+        signature["hash"] = file_hash(path)
+    return signature
+
+
+def _entry_dir(coord_file, cap_file, cache_dir):
+    # One entry per pair of input paths; the entry's metadata decides whether it is still valid
+    key = f"{os.path.abspath(coord_file)}\0{os.path.abspath(cap_file)}".encode()
+    return os.path.join(cache_dir, hashlib.blake2b(key, digest_size=12).hexdigest())
+
+
+def _read_meta(entry):
+    try:
+        with open(os.path.join(entry, "meta.json")) as file:
+            return json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _write_meta(entry, meta):
+    tmp_path = os.path.join(entry, "meta.json.tmp")
+    with open(tmp_path, 'w') as file:
+        json.dump(meta, file, indent=2)
+    os.replace(tmp_path, os.path.join(entry, "meta.json"))
+
+
+def _is_fresh(entry, meta):
+    """Check an entry against its inputs, refreshing recorded mtimes when only the mtime changed"""
+    if meta is None or meta.get("version") != CACHE_VERSION:
+        return False
+
+    touched = False
+    for recorded in meta["inputs"]:
+        current = _file_signature(recorded["path"], with_hash=False)
+        if current["exists"] != recorded["exists"]:
+            return False
+        if not current["exists"]:
+            continue
+        if current["size"] != recorded["size"]:
+            return False
+        if current["mtime_ns"] != recorded["mtime_ns"]:
+            # Same size but touched: only the content hash can tell whether it really changed
+            if file_hash(recorded["path"]) != recorded["hash"]:
+                return False
+            recorded["mtime_ns"] = current["mtime_ns"]
+            touched = True
+
+    if touched:
+        _write_meta(entry, meta)
+    return True
+
+
+def _load_entry(entry, mmap_mode=None):
+    columns = {name: np.load(os.path.join(entry, f"{name}.npy"), mmap_mode=mmap_mode) for name in _COLUMNS}
+    return SinkData(**columns)
+
+
+def _store_entry(entry, sinks, inputs):
+    # Write into a temporary directory and rename it so readers never see a half-written entry
+    tmp_entry = f"{entry}.tmp{os.getpid()}"
+    shutil.rmtree(tmp_entry, ignore_errors=True)
+    os.makedirs(tmp_entry)
+    for name in _COLUMNS:
+        np.save(os.path.join(tmp_entry, f"{name}.npy"), getattr(sinks, name))
+    _write_meta(tmp_entry, {"version": CACHE_VERSION, "created": time.time(), "count": len(sinks), "inputs": inputs})
+    shutil.rmtree(entry, ignore_errors=True)
+    os.replace(tmp_entry, entry)
+
+
+def warm(coord_file, cap_file, cache_dir=DEFAULT_CACHE_DIR):
+    """Parse the inputs and (re)write their cache entry; returns the parsed SinkData"""
+    # Sign the inputs before parsing so a change during the parse makes the entry stale
+    inputs = [_file_signature(coord_file), _file_signature(cap_file)]
+    sinks = XYCoordinateExtractor(coord_file, cap_file).extract_columns()
+    _store_entry(_entry_dir(coord_file, cap_file, cache_dir), sinks, inputs)
+    return sinks
+
+
+def load_design(coord_file, cap_file, cache_dir=DEFAULT_CACHE_DIR, mmap_mode=None):
+    """Load the parsed sinks for the given inputs, from the cache when it is still valid
+
+    A stale entry (an input changed size or content, appeared or disappeared) is evicted and
+    rebuilt from the input files. With mmap_mode='r' the columns are memory-mapped instead of
+    read into memory.
+    """
+    entry = _entry_dir(coord_file, cap_file, cache_dir)
+    if _is_fresh(entry, _read_meta(entry)):
+        start_time = time.perf_counter()
+        sinks = _load_entry(entry, mmap_mode)
+        print(f"Loaded {len(sinks)} sinks from cache in {(time.perf_counter() - start_time) * 1000:.1f} ms")
+        return sinks
+
+    shutil.rmtree(entry, ignore_errors=True)
+    sinks = warm(coord_file, cap_file, cache_dir)
+    # Hand out the memory-mapped columns even on a cold cache when they were asked for
+    return sinks if mmap_mode is None else _load_entry(entry, mmap_mode)
+
+
+def design_key(coord_file, cap_file, cache_dir=DEFAULT_CACHE_DIR):
+    """Digest identifying the contents of a design's inputs, for caches of results computed from it
+
+    Uses the hashes recorded in the design's cache entry, parsing and caching the inputs first
+    when the entry is missing or stale.
+    """
+    entry = _entry_dir(coord_file, cap_file, cache_dir)
+    meta = _read_meta(entry)
+    if not _is_fresh(entry, meta):
+        warm(coord_file, cap_file, cache_dir)
+        meta = _read_meta(entry)
+    digest = hashlib.blake2b(str(CACHE_VERSION).encode(), digest_size=16)
+    for recorded in meta["inputs"]:
+        digest.update(recorded.get("hash", "missing").encode())
+    return digest.hexdigest()
+
+
+def evict_stale(cache_dir=DEFAULT_CACHE_DIR):
+    """Remove every entry whose inputs changed; returns the number of entries removed"""
+    removed = 0
+    if not os.path.isdir(cache_dir):
+        return removed
+    for name in os.listdir(cache_dir):
+        entry = os.path.join(cache_dir, name)
+        if os.path.isdir(entry) and not _is_fresh(entry, _read_meta(entry)):
+            shutil.rmtree(entry, ignore_errors=True)
+            removed += 1
+    return removed
+
+
+def clear(cache_dir=DEFAULT_CACHE_DIR, coord_file=None, cap_file=None):
+    """Remove the entry for the given inputs, or the whole cache when no inputs are given"""
+    if coord_file is None or cap_file is None:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    else:
+        shutil.rmtree(_entry_dir(coord_file, cap_file, cache_dir), ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the parsed-design cache")
+    parser.add_argument("command", choices=["warm", "clear", "prune"],
+                        help="warm: parse and cache the inputs; clear: delete cached entries; prune: evict stale entries")
+    parser.add_argument("--coord", default=os.path.join("input", "data.txt"), help="Coordinate file")
+    parser.add_argument("--cap", default=os.path.join("input", "capacitenceData.txt"), help="Capacitance (SPEF) file")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="Cache directory")
+    parser.add_argument("--all", action="store_true", help="With clear: delete every entry, not just the one for --coord/--cap")
+    args = parser.parse_args()
+
+    if args.command == "warm":
+        sinks = warm(args.coord, args.cap, args.cache_dir)
+        print(f"Cached {len(sinks)} sinks in {args.cache_dir}")
+    elif args.command == "clear":
+        if args.all:
+            clear(args.cache_dir)
+            print(f"Cleared {args.cache_dir}")
+        else:
+            clear(args.cache_dir, args.coord, args.cap)
+            print(f"Cleared the entry for {args.coord} and {args.cap} "
+                  f"({_entry_dir(args.coord, args.cap, args.cache_dir)})")
+    else:
+        print(f"Evicted {evict_stale(args.cache_dir)} stale entries from {args.cache_dir}")
+
+
+if __name__ == "__main__":
+    main()
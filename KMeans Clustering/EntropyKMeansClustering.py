@@ -1,41 +1,159 @@
+import hashlib
+import threading
+from collections import OrderedDict
 import numpy as np
-from scipy.spatial.distance import cdist
+from KMeansClusteringHelper import DEFAULT_BLOCK_BYTES, KMeansModel, as_points, check_metric
+from scipy.spatial import cKDTree
 
-class EntropyKMeansClustering:
-    def __init__(self, k=3, max_iterations=100, random_state=42):
-        self.k = k
+
+def minkowski_p(metric='sqeuclidean'):
+    """Order of the norm the neighbor search uses for a clustering metric: 1 for manhattan, else 2
+
+    The entropies are a softmax over neighbor distances, so both euclidean metrics use plain
+    (not squared) L2 distances there.
+    """
+    check_metric(metric)
+    return 1 if metric == 'manhattan' else 2
+
+
+def nearest_neighbor_distances(data_points, neighborhood_size=5, metric='sqeuclidean'):
+    """Sorted distances from every point to its neighborhood_size nearest neighbors (self excluded)
+
+    Uses a KD-tree, so this is O(N log N) time and O(N * neighborhood_size) memory instead of
+    a full N x N distance matrix.
+    """
+    n_neighbors = min(neighborhood_size + 1, data_points.shape[0])
+    tree = cKDTree(data_points)
+    distances, _ = tree.query(data_points, k=n_neighbors, p=minkowski_p(metric))
+    distances = distances.reshape(data_points.shape[0], n_neighbors)
+    # The first column is each point's distance to itself (or to an exact duplicate), both zero
+    return distances[:, 1:]
+
+
+def entropy_from_distances(neighbor_distances):
+    """Shannon entropy of the softmax over each row of an (N, k) neighbor distance array"""
+    # Softmax is shift invariant; shifting by the nearest distance keeps exp() from underflowing
+    shifted = neighbor_distances - neighbor_distances[:, :1]
+    exp_distances = np.exp(-shifted)
+    probabilities = exp_distances / np.sum(exp_distances, axis=1, keepdims=True)
+    return -np.sum(probabilities * np.log(probabilities + 1e-10), axis=1)
+
+
+def calculate_entropy(data_points, neighborhood_size=5, metric='sqeuclidean'):
+    """Calculate entropy for each point based on its neighborhood"""
+    data_points = np.asarray(data_points, dtype=np.float64)
+    if data_points.shape[0] < 2:
+        return np.zeros(data_points.shape[0])
+    return entropy_from_distances(nearest_neighbor_distances(data_points, neighborhood_size, metric))
+
+
+def points_key(data_points):
+    """Digest of a point array's shape and contents, identifying a dataset across calls"""
+    data_points = np.ascontiguousarray(data_points, dtype=np.float64)
+    digest = hashlib.blake2b(repr(data_points.shape).encode(), digest_size=16)
+    digest.update(memoryview(data_points).cast('B'))
+    return digest.hexdigest()
+
+
+class NeighborhoodCache:
+    """Per-dataset memo of the KD-tree, the sorted neighbor distances and the entropies
+
+    The entropies depend only on the points, the neighborhood size and the norm of the metric,
+    so fits for different K reuse them. One KD-tree serves both norms. Per norm, the neighbor
+    distances are kept for the largest neighborhood queried so far;
+    a smaller size is a column slice of them and a larger one queries only the missing ranks
+    (at least doubling the stored ranks).
+    At most max_datasets datasets are kept, least recently used first out.
+    """
+
+    def __init__(self, max_datasets=4):
+        self.max_datasets = max_datasets
+        self.datasets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _dataset(self, data_points):
+        # Called with the lock held
+        key = points_key(data_points)
+        if key in self.datasets:
+            self.datasets.move_to_end(key)
+            return self.datasets[key]
+        points = np.array(data_points, dtype=np.float64)
+        dataset = {"points": points, "tree": cKDTree(points), "distances": {}, "entropies": {}}
+        self.datasets[key] = dataset
+        while len(self.datasets) > self.max_datasets:
+            self.datasets.popitem(last=False)
+        return dataset
+
+    def neighbor_distances(self, data_points, neighborhood_size=5, metric='sqeuclidean'):
+        """Same as nearest_neighbor_distances, computing only ranks not queried before"""
+        with self.lock:
+            return self._neighbor_distances(self._dataset(data_points), neighborhood_size, minkowski_p(metric))
+
+    @staticmethod
+    def _neighbor_distances(dataset, neighborhood_size, p=2):
+        # Called with the lock held
+        distances = dataset["distances"].get(p, np.empty((dataset["points"].shape[0], 0)))
+        wanted = min(neighborhood_size, dataset["points"].shape[0] - 1)
+        if wanted > distances.shape[1]:
+            # A query for the missing ranks still walks the tree as deep as the highest rank, so
+            # grow geometrically to make a run of increasing sizes cost a few queries in total
+            grown = min(max(wanted, 2 * distances.shape[1]), dataset["points"].shape[0] - 1)
+            # Rank 1 is each point itself, so neighbor j (1-based) is rank j + 1
+            ranks = list(range(distances.shape[1] + 2, grown + 2))
+            extra, _ = dataset["tree"].query(dataset["points"], k=ranks, p=p)
+            distances = np.hstack([distances, extra.reshape(distances.shape[0], len(ranks))])
+            dataset["distances"][p] = distances
+        return distances[:, :wanted]
+
+    def entropies(self, data_points, neighborhood_size=5, metric='sqeuclidean'):
+        """Same as calculate_entropy, memoized per dataset, neighborhood size and norm"""
+        if np.shape(data_points)[0] < 2:
+            return np.zeros(np.shape(data_points)[0])
+        p = minkowski_p(metric)
+        with self.lock:
+            dataset = self._dataset(data_points)
+            if (neighborhood_size, p) not in dataset["entropies"]:
+                distances = self._neighbor_distances(dataset, neighborhood_size, p)
+                dataset["entropies"][neighborhood_size, p] = entropy_from_distances(distances)
+            return dataset["entropies"][neighborhood_size, p]
+
+    def precompute(self, data_points, neighborhood_sizes=(5,), metric='sqeuclidean'):
+        """Compute the entropies for several neighborhood sizes ahead of the fits, largest query first"""
+        self.neighbor_distances(data_points, max(neighborhood_sizes), metric)
+        for neighborhood_size in neighborhood_sizes:
+            self.entropies(data_points, neighborhood_size, metric)
+
+    def clear(self):
+        with self.lock:
+            self.datasets.clear()
+
+
+# Shared by every EntropyKMeansClustering that is not given its own cache
+shared_neighborhood_cache = NeighborhoodCache()
+
+
+class EntropyKMeansClustering(KMeansModel):
+    def __init__(self, k=3, max_iterations=100, random_state=42, block_bytes=DEFAULT_BLOCK_BYTES, dtype=np.float64,
+                 algorithm='lloyd', batch_size=1024, learning_rate='count', tol=1e-4, max_no_improvement=10,
+                 init='uniform', n_init=1, n_jobs=1, executor='thread', neighborhood_cache=None, metric='sqeuclidean'):
+        super().__init__(k, random_state, block_bytes, dtype, algorithm, batch_size, learning_rate, tol,
+                         max_no_improvement, init, n_init, n_jobs, executor, metric)
         self.max_iterations = max_iterations
-        self.centroids = None
         self.weights = None
-        self.random_state = random_state
-        # Set random seed for reproducibility
-        np.random.seed(random_state)
+        # Memo of the entropies per dataset and neighborhood size, shared between models by default
+        self.neighborhood_cache = neighborhood_cache if neighborhood_cache is not None else shared_neighborhood_cache
 
     def calculate_entropy(self, data_points, neighborhood_size=5):
-        """Calculate entropy for each point based on its neighborhood"""
-        n_points = data_points.shape[0]
-        entropies = np.zeros(n_points)
-        
-        # Calculate pairwise distances
-        distances = cdist(data_points, data_points)
-        
-        for i in range(n_points):
-            # Get k-nearest neighbors
-            neighbor_indices = np.argsort(distances[i])[1:neighborhood_size+1]  # Exclude self
-            neighbor_distances = distances[i][neighbor_indices]
-            
-            # Calculate probabilities based on distances using softmax
-            exp_distances = np.exp(-neighbor_distances)
-            probabilities = exp_distances / np.sum(exp_distances)
-            
-            # Calculate Shannon entropy
-            entropy = -np.sum(probabilities * np.log(probabilities + 1e-10))
-            entropies[i] = entropy
-            
-        return entropies
+        """Calculate entropy for each point based on its neighborhood in the model's metric (memoized)"""
+        return self.neighborhood_cache.entropies(data_points, neighborhood_size, self.metric)
+
+    def precompute_entropy(self, data_points, neighborhood_sizes=(5,)):
+        """Compute the entropies for the neighborhood sizes that later fits will use"""
+        self.neighborhood_cache.precompute(as_points(data_points, self.dtype), neighborhood_sizes, self.metric)
 
     def set_weights(self, weights):
-        """Set the weights to use for clustering (e.g., capacitance values)"""
+        """Set the weights to use for clustering (e.g., capacitance values or a SinkData table)"""
+        weights = getattr(weights, 'capacitances', weights)
         # Convert to numpy array with higher precision
         self.weights = np.array(weights, dtype=np.float64)
         
@@ -49,10 +167,9 @@ class EntropyKMeansClustering:
         weight_sum = np.sum(self.weights)
         self.weights = self.weights / weight_sum
 
-    def fit(self, data_points, neighborhood_size=5):
+    def fit(self, data_points, neighborhood_size=5, out=None, init=None, callback=None):
         """Fit the model to the data points"""
-        n_points = data_points.shape[0]
-        n_features = data_points.shape[1]
+        data_points = as_points(data_points, self.dtype)
         
         # Ensure weights are set
         if self.weights is None:
@@ -66,34 +183,10 @@ class EntropyKMeansClustering:
         combined_weights = self.weights * (1 + entropies)
         combined_weights = combined_weights / np.sum(combined_weights)  # Normalize
         
-        # Initialize centroids randomly within the data bounds
-        min_vals = np.amin(data_points, axis=0)
-        max_vals = np.amax(data_points, axis=0)
-        self.centroids = np.random.uniform(min_vals, max_vals, size=(self.k, n_features))
-        
-        # Initialize labels
-        labels = np.zeros(n_points, dtype=int)
-        
-        for _ in range(self.max_iterations):
-            old_labels = labels.copy()
-            
-            # Assign points to clusters
-            for i in range(n_points):
-                distances = np.linalg.norm(data_points[i] - self.centroids, axis=1)
-                weighted_distances = distances * combined_weights[i]
-                labels[i] = np.argmin(weighted_distances)
-            
-            # Update centroids
-            for j in range(self.k):
-                if np.sum(labels == j) > 0:
-                    cluster_points = data_points[labels == j]
-                    cluster_weights = combined_weights[labels == j]
-                    weighted_sum = np.sum(cluster_points * cluster_weights[:, np.newaxis], axis=0)
-                    weight_sum = np.sum(cluster_weights)
-                    self.centroids[j] = weighted_sum / weight_sum
-            
-            # Check for convergence
-            if np.array_equal(old_labels, labels):
-                break
-        
-        return labels 
\ No newline at end of file
+        # Each restart seeds the centroids ('uniform' draws them randomly within the data bounds; the
+        # k-means++ variants favour heavier points) and runs the shared weighted Lloyd or mini-batch
+        # kernel; labels go into out when a preallocated, e.g. memory-mapped, array is given, and
+        # callback(iteration, shift, inertia) follows the progress of every iteration
+        labels = self._fit_restarts(data_points, combined_weights, self.max_iterations, None, out, init, callback)
+
+        return labels
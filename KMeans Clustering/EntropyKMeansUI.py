@@ -4,13 +4,13 @@ import tkinter as tk
 from tkinter import ttk
 
 class EntropyKMeansUI(BaseClusteringUI):
-    def __init__(self, root):
+    def __init__(self, root, result_cache=None):
         # Create neighborhood size control first
         self.neighborhood_size = ttk.Spinbox(None, from_=2, to=20, width=5)
         self.neighborhood_size.set(5)  # Default value
         
         # Then call parent's init
-        super().__init__(root, title="Entropy-based K-Means Clustering UI", mode="entropy")
+        super().__init__(root, title="Entropy-based K-Means Clustering UI", mode="entropy", result_cache=result_cache)
         
         # Create the actual control in the UI
         self.create_neighborhood_control()
@@ -29,47 +29,23 @@ class EntropyKMeansUI(BaseClusteringUI):
                                                 command=self.update_plot)
         self.update_neighborhood_btn.grid(row=1, column=0, columnspan=2, pady=5)
         
-    def update_plot(self):
-        try:
-            k = int(self.k_value.get())
-            neighborhood_size = int(self.neighborhood_size.get())
-            self.current_k = k
-            
-            # Clear the plot
-            self.ax.clear()
-            
-            # Run Entropy K-means
-            kmeans = EntropyKMeansClustering(k=k)
-            kmeans.set_weights(self.capacitances)
-            self.current_labels = kmeans.fit(self.points, neighborhood_size=neighborhood_size)
-            
-            # Plot data points with cluster colors
-            scatter = self.ax.scatter(self.points[:, 0], self.points[:, 1], 
-                                    c=self.current_labels, cmap='rainbow', alpha=0.5)
-            
-            # Plot centroids
-            self.ax.scatter(kmeans.centroids[:, 0], kmeans.centroids[:, 1], 
-                          c='black', marker='x', s=200, label='Centroids')
-            
-            # Update centroid display
-            self.centroid_text.delete(1.0, tk.END)
-            self.centroid_text.insert(tk.END, f"K = {k}\n")
-            self.centroid_text.insert(tk.END, f"Neighborhood Size = {neighborhood_size}\n\n")
-            for i, centroid in enumerate(kmeans.centroids):
-                self.centroid_text.insert(tk.END, f"Centroid {i+1}:\n")
-                self.centroid_text.insert(tk.END, f"X: {centroid[0]:.4f}\n")
-                self.centroid_text.insert(tk.END, f"Y: {centroid[1]:.4f}\n\n")
-            
-            self.ax.set_title(f'Entropy-based K-Means Clustering (K={k}, N={neighborhood_size})')
-            self.ax.set_xlabel('X')
-            self.ax.set_ylabel('Y')
-            self.ax.legend()
-            
-            # Update canvas
-            self.canvas.draw()
-            
-        except ValueError as e:
-            print(f"Error: {e}")
+    def fit_params(self):
+        params = super().fit_params()
+        params['neighborhood_size'] = int(self.neighborhood_size.get())
+        return params
+        
+    def run_fit(self, params, callback):
+        # Run Entropy K-means
+        kmeans = EntropyKMeansClustering(k=params['k'], algorithm=params['algorithm'], random_state=params['seed'])
+        kmeans.set_weights(self.capacitances)
+        labels = kmeans.fit(self.points, neighborhood_size=params['neighborhood_size'], callback=callback)
+        return labels, kmeans.centroids
+        
+    def describe_params(self, params):
+        return f"K = {params['k']}\nNeighborhood Size = {params['neighborhood_size']}\n\n"
+        
+    def plot_title(self, params):
+        return f"Entropy-based K-Means Clustering (K={params['k']}, N={params['neighborhood_size']})"
 
 def main():
     root = tk.Tk()
@@ -1,6 +1,184 @@
+import os
 import re
+import time
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 
+# Block size for streaming the SPEF file
+SPEF_READ_BUFFER = 16 * 1024 * 1024
+
+# Bytes read per block when parsing the coordinate file in chunks
+COORD_READ_BUFFER = 16 * 1024 * 1024
+
+# Coordinate files larger than this are parsed by a process pool, one block per task
+PARALLEL_PARSE_BYTES = 64 * 1024 * 1024
+
+# Coordinate lines: "<instance_name> : X = {<x>, Y = <y>}"
+_COORD_ENTRY = re.compile(rb"^[ \t]*(.*?)\s*:\s*X\s*=\s*{([\d.]+),\s*Y\s*=\s*([\d.]+)}", re.MULTILINE)
+
+# Pin suffixes tried, in order, when a sink's bare ID has no capacitance
+_CAP_SUFFIXES = (b':A', b':Q', b':Z', b':Y')
+
+# SPEF sections the streaming parser tracks
+_NAME_MAP, _CAP, _SKIP = 'name_map', 'cap', 'skip'
+
+# Section marker lines: *NAME_MAP and *PORTS must match exactly, the others by prefix
+_SPEF_SECTION = re.compile(rb'^[ \t]*\*(?:(NAME_MAP|PORTS)[ \t\r]*$|(CAP|RES|CONN|D_NET|END))[^\n]*', re.MULTILINE)
+_SECTION_AFTER = {
+    b'NAME_MAP': _NAME_MAP,
+    b'PORTS': None,
+    b'CAP': _CAP,
+    b'RES': _SKIP,
+    b'CONN': _SKIP,
+    b'D_NET': None,
+    b'END': None,
+}
+
+# "*8688 Data_Memory_inst_memory_reg\[3\]\[28\]" inside *NAME_MAP
+_NAME_MAP_ENTRY = re.compile(rb'^[ \t]*(\*\d\S*)[ \t]+([^\n]*?)[ \t\r]*$', re.MULTILINE)
+
+# ":CK" entries inside *CAP, either "<index> <node> <cap>" or "<node> <cap> <more>"
+_CK_CAP_ENTRY = re.compile(
+    rb'^[ \t]*(?:\d+[ \t]+(\*\S*:CK)[ \t]+(\S+)|(\*\S*:CK)[ \t]+(\S+)[ \t]+\S)',
+    re.MULTILINE,
+)
+
+
+def _find_line_marker(block, marker, start):
+    """Index of the next occurrence of marker at the start of a line (after indentation), or -1"""
+    index = block.find(marker, start)
+    while index >= 0:
+        line_start = block.rfind(b'\n', 0, index) + 1
+        if not block[line_start:index].strip():
+            return index
+        index = block.find(marker, index + 1)
+    return index
+
+def _line_ranges(path, block_bytes=COORD_READ_BUFFER):
+    """(start, end) byte ranges of about block_bytes covering a file, each ending at a line end"""
+    size = os.path.getsize(path)
+    ranges = []
+    start = 0
+    with open(path, 'rb') as file:
+        while start < size:
+            end = min(start + block_bytes, size)
+            if end < size:
+                file.seek(end)
+                end += len(file.readline())
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def _parse_coordinate_block(block):
+    """Labels (bytes array) and (N, 2) points of the coordinate lines in a block of whole lines"""
+    matches = _COORD_ENTRY.findall(block)
+    if not matches:
+        return np.empty(0, dtype='S1'), np.empty((0, 2), dtype=np.float64)
+    labels, xs, ys = zip(*matches)
+    points = np.empty((len(matches), 2), dtype=np.float64)
+    # Convert the numbers in C: one join and one fromstring per column instead of float() per value
+    points[:, 0] = np.fromstring(b' '.join(xs), dtype=np.float64, sep=' ')
+    points[:, 1] = np.fromstring(b' '.join(ys), dtype=np.float64, sep=' ')
+    return np.array(labels, dtype=bytes), points
+
+
+def _parse_coordinate_range(path, start, end):
+    with open(path, 'rb') as file:
+        file.seek(start)
+        return _parse_coordinate_block(file.read(end - start))
+
+
+def parse_coordinate_file(path, workers=None, block_bytes=COORD_READ_BUFFER):
+    """Labels (bytes array) and (N, 2) points of every coordinate line in a file, in file order
+
+    The file is cut into blocks on line boundaries; above PARALLEL_PARSE_BYTES (and unless
+    workers is 1) the blocks are parsed by a process pool.
+    """
+    ranges = _line_ranges(path, block_bytes)
+    if os.path.getsize(path) <= PARALLEL_PARSE_BYTES or workers == 1 or len(ranges) < 2:
+        parts = [_parse_coordinate_range(path, start, end) for start, end in ranges]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(_parse_coordinate_range, [path] * len(ranges),
+                                  [start for start, _ in ranges], [end for _, end in ranges]))
+    if not parts:
+        return np.empty(0, dtype='S1'), np.empty((0, 2), dtype=np.float64)
+    return np.concatenate([labels for labels, _ in parts]), np.vstack([points for _, points in parts])
+
+
+def _factorize(labels):
+    """Sorted unique labels and each label's index among them, like np.unique(return_inverse=True)
+
+    Sorts a raw-bytes view of the fixed-width labels, which orders them the same way as comparing
+    the byte strings but takes half the time.
+    """
+    if labels.size == 0:
+        return labels, np.empty(0, dtype=np.int32)
+    order = np.argsort(labels.view(f'V{labels.itemsize}'), kind='stable')
+    ordered = labels[order]
+    starts = np.concatenate([[True], ordered[1:] != ordered[:-1]])
+    codes = np.empty(labels.size, dtype=np.int32)
+    codes[order] = np.cumsum(starts) - 1
+    return ordered[starts], codes
+
+
+def _decode(strings):
+    """Byte strings as str: a plain ASCII cast when possible, UTF-8 decoding otherwise"""
+    try:
+        return strings.astype(str)
+    except UnicodeDecodeError:
+        return np.char.decode(strings, 'utf-8')
+
+
+def _sorted_lookup(keys, values, queries, default):
+    """values[keys == query] for every query (keys sorted and unique), default where absent"""
+    result = np.full(queries.shape, default, dtype=values.dtype)
+    found = np.zeros(queries.shape, dtype=bool)
+    if keys.size and queries.size:
+        position = np.minimum(np.searchsorted(keys, queries), keys.size - 1)
+        found = keys[position] == queries
+        result[found] = values[position[found]]
+    return result, found
+
+
+class SinkData:
+    """Columnar table of sinks: one array per field instead of one dictionary per sink"""
+
+    def __init__(self, points, capacitances, label_codes, label_table, numeric_ids):
+        self.points = points              # (N, 2) float64 X/Y coordinates
+        self.capacitances = capacitances  # (N,) float64 CK pin capacitance, 0.0 when unknown
+        self.label_codes = label_codes    # (N,) int32 index of each sink's label in label_table
+        self.label_table = label_table    # unique instance names
+        self.numeric_ids = numeric_ids    # (N,) SPEF name map ID (e.g. *8688), '' when unmapped
+
+    @classmethod
+    def empty(cls):
+        return cls(np.empty((0, 2), dtype=np.float64), np.empty(0, dtype=np.float64),
+                   np.empty(0, dtype=np.int32), np.empty(0, dtype=str), np.empty(0, dtype=str))
+
+    def __len__(self):
+        return self.points.shape[0]
+
+    @property
+    def labels(self):
+        """Instance name of every sink, decoded from the label table"""
+        return self.label_table[self.label_codes]
+
+    def to_records(self):
+        """List of per-sink dictionaries in the format extract_coordinates has always returned"""
+        return [
+            {
+                "label": str(self.label_table[code]),
+                "x": float(x),
+                "y": float(y),
+                "numeric_id": str(numeric_id) or None,
+                "capacitance": capacitance
+            }
+            for code, (x, y), numeric_id, capacitance
+            in zip(self.label_codes, self.points, self.numeric_ids, self.capacitances)
+        ]
+
 class XYCoordinateExtractor:
     def __init__(self, coord_file, cap_file):
         self.coord_file = coord_file
@@ -8,131 +186,186 @@ class XYCoordinateExtractor:
         self.xy_values = []
         self.capacitances = {}
         self.label_to_id = {}
+        self.spef_throughput = None  # MB/s of the last SPEF parse
+        self._spef_parsed = False
+        self._lookup_tables = None  # Sorted label -> ID and ID -> capacitance arrays for the joins
 
-    def extract_label_mapping(self):
-        """Extract mapping between labels and their numeric IDs from capacitance file"""
+    def parse_capacitance_file(self):
+        """Read the label mapping and the :CK capacitances from the SPEF file in one streaming pass
+
+        The file is read as bytes in fixed-size blocks cut on line boundaries, so memory stays
+        bounded by the block size plus the mapping tables. Only *NAME_MAP and *CAP bodies are
+        scanned (with compiled byte regexes); everything else, including the *RES and *CONN
+        blocks, is jumped over with bytes.find without touching its lines in Python.
+        """
+        if self._spef_parsed:
+            return
         try:
-            with open(self.cap_file, 'r') as file:
-                in_name_map = False
-                for line in file:
-                    line = line.strip()
-                    
-                    # Check for section markers
-                    if line == '*NAME_MAP':
-                        in_name_map = True
-                        continue
-                    elif line == '*PORTS':
-                        in_name_map = False
-                        continue
-                    
-                    # Only process lines within the name map section
-                    if in_name_map and re.match(r'^\*\d+', line):
-                        parts = line.split()
-                        if len(parts) >= 2:
-                            numeric_id = parts[0]  # e.g., *8688
-                            # Join the rest of the parts to get the full label and unescape brackets
-                            label = ' '.join(parts[1:])  # e.g., Data_Memory_inst_memory_reg\[3\]\[28\]
-                            # Replace escaped brackets with regular brackets
-                            label = label.replace('\\[', '[').replace('\\]', ']')
-                            self.label_to_id[label] = numeric_id
+            start_time = time.perf_counter()
+            n_bytes = 0
+            section = None
+            leftover = b''
+            with open(self.cap_file, 'rb', buffering=0) as file:
+                while True:
+                    data = file.read(SPEF_READ_BUFFER)
+                    n_bytes += len(data)
+                    block = leftover + data
+                    if data:
+                        # Keep the trailing partial line for the next block
+                        cut = block.rfind(b'\n') + 1
+                        block, leftover = block[:cut], block[cut:]
+                    if block:
+                        section = self._parse_spef_block(block, section)
+                    if not data:
+                        break
+
+            elapsed = time.perf_counter() - start_time
+            megabytes = n_bytes / (1024 * 1024)
+            self.spef_throughput = megabytes / elapsed if elapsed > 0 else float('inf')
+            self._spef_parsed = True
+            print(f"Parsed {megabytes:.1f} MB of SPEF in {elapsed:.2f} s ({self.spef_throughput:.1f} MB/s)")
         except FileNotFoundError:
             print(f"❌ Error: Capacitance file not found at path: {self.cap_file}")
+            # Report a missing file once; every sink then gets a capacitance of 0
+            self._spef_parsed = True
+
+    def _parse_spef_block(self, block, section):
+        """Parse one block of whole lines starting in the given section; return the section at its end"""
+        position = 0
+        name_map_start = _find_line_marker(block, b'*NAME_MAP', 0)
+        while position < len(block):
+            if section is _NAME_MAP or section is _CAP:
+                # Parse up to the next section marker
+                marker = _SPEF_SECTION.search(block, position)
+                end = marker.start() if marker else len(block)
+                self._parse_spef_section(block, position, end, section)
+                if marker is None:
+                    break
+                section = _SECTION_AFTER[marker.group(1) or marker.group(2)]
+                position = marker.end()
+                continue
+
+            # Outside *NAME_MAP and *CAP nothing is parsed, so jump straight to the next one of them
+            cap_start = _find_line_marker(block, b'*CAP', position)
+            if name_map_start >= position and (cap_start < 0 or name_map_start < cap_start):
+                marker_start, section = name_map_start, _NAME_MAP
+            elif cap_start >= 0:
+                marker_start, section = cap_start, _CAP
+            else:
+                # The rest of the block is *RES, *CONN or other sections we don't need
+                break
+            position = block.find(b'\n', marker_start) + 1 or len(block)
+        return section
+
+    def _parse_spef_section(self, block, start, end, section):
+        if section == _NAME_MAP:
+            for numeric_id, label in _NAME_MAP_ENTRY.findall(block, start, end):
+                # Join the parts of the label with single spaces and unescape brackets
+                label = b' '.join(label.split()).decode()  # e.g., Data_Memory_inst_memory_reg\[3\]\[28\]
+                label = label.replace('\\[', '[').replace('\\]', ']')
+                self.label_to_id[label] = numeric_id.decode()  # e.g., *8688
+        elif section == _CAP and block.find(b':CK', start, end) >= 0:
+            # The format can be either "1378 *9570:CK 3.67885e-05" or "*9570:CK 3.68013e-05 ..."
+            for indexed_node, indexed_cap, node, cap in _CK_CAP_ENTRY.findall(block, start, end):
+                try:
+                    value = np.float64(float(indexed_cap or cap))
+                except ValueError:
+                    # Skip lines that don't have valid capacitance values
+                    continue
+                # Store just the numeric ID part (e.g., *9570 from *9570:CK)
+                self.capacitances[(indexed_node or node)[:-3].decode()] = value
+
+    def extract_label_mapping(self):
+        """Extract mapping between labels and their numeric IDs from capacitance file"""
+        self.parse_capacitance_file()
 
     def extract_capacitances(self):
         """Extract capacitance values for each numeric ID"""
-        try:
-            with open(self.cap_file, 'r') as file:
-                in_cap_section = False
-
-                for line in file:
-                    line = line.strip()
-
-                    if line.startswith('*D_NET') or line.startswith('*RES') or line.startswith('*END') or line.startswith('*CONN'):
-                        in_cap_section = False
-                    elif line.startswith('*CAP'):
-                        in_cap_section = True
-                        continue
-
-                    if in_cap_section and line:
-                        parts = line.split()
-                        # Skip if we don't have enough parts
-                        if len(parts) < 3:
-                            continue
-
-                        try:
-                            # The format can be either:
-                            # "1378 *9570:CK 3.67885e-05" or
-                            # "*9570:Q 3.68013e-05"
-                            # So we need to check if the first part is a number
-                            if parts[0].isdigit():
-                                # Skip the number and use the next parts
-                                node = parts[1]
-                                cap = np.float64(parts[2])
-                            else:
-                                # No number at start, use first two parts
-                                node = parts[0]
-                                cap = np.float64(parts[1])
-
-                            # Only store if the node has a CK suffix
-                            if node.startswith('*') and node.endswith(':CK'):
-                                # Extract just the numeric ID part (e.g., *9570 from *9570:CK)
-                                numeric_id = node.split(':')[0]
-                                self.capacitances[numeric_id] = cap
-
-                        except (ValueError, IndexError):
-                            # Skip lines that don't have valid capacitance values
-                            continue
+        self.parse_capacitance_file()
+
+    def _tables(self):
+        """The SPEF mappings as sorted byte-string arrays, built once for the vectorized joins"""
+        if self._lookup_tables is None:
+            names = np.array([label.encode() for label in self.label_to_id], dtype=bytes)
+            ids = np.array([numeric_id.encode() for numeric_id in self.label_to_id.values()], dtype=bytes)
+            nodes = np.array([node.encode() for node in self.capacitances], dtype=bytes)
+            values = np.fromiter(self.capacitances.values(), dtype=np.float64, count=len(self.capacitances))
+            name_order, node_order = np.argsort(names), np.argsort(nodes)
+            self._lookup_tables = names[name_order], ids[name_order], nodes[node_order], values[node_order]
+        return self._lookup_tables
 
+    def join_capacitances(self, labels):
+        """SPEF IDs (b'' when unmapped) and capacitances (0.0 when unknown) for an array of byte labels
+
+        Done with sorted searches over the whole array instead of a dictionary probe per sink: the
+        bare ID first, then the common pin suffixes in order for sinks whose bare ID has none.
+        """
+        names, ids, nodes, values = self._tables()
+        numeric_ids, _ = _sorted_lookup(names, ids, labels, b'')
+        capacitances, _ = _sorted_lookup(nodes, values, numeric_ids, 0.0)
+        unresolved = np.flatnonzero((capacitances == 0.0) & (numeric_ids != b''))
+        for suffix in _CAP_SUFFIXES:
+            if unresolved.size == 0:
+                break
+            suffixed, found = _sorted_lookup(nodes, values, np.char.add(numeric_ids[unresolved], suffix), 0.0)
+            capacitances[unresolved[found]] = suffixed[found]
+            unresolved = unresolved[~found]
+        return numeric_ids, capacitances
+
+    def iter_chunks(self, chunk_size=1 << 20):
+        """Yield (points, capacitances) arrays of up to chunk_size sinks, in file order
+
+        The coordinate file is read in blocks cut on line boundaries, so memory stays bounded by
+        the block and chunk sizes (plus the SPEF mapping tables) however large the file is. Every
+        call starts a new pass over the file; the SPEF file is parsed only on the first.
+        """
+        self.parse_capacitance_file()
+        pending_points, pending_capacitances = [], []
+        n_pending = 0
+        try:
+            ranges = _line_ranges(self.coord_file)
         except FileNotFoundError:
-            print(f"❌ Error: Capacitance file not found at path: {self.cap_file}")
+            print(f"❌ Error: Coordinate file not found at path: {self.coord_file}")
+            return
+        for start, end in ranges:
+            labels, points = _parse_coordinate_range(self.coord_file, start, end)
+            pending_points.append(points)
+            pending_capacitances.append(self.join_capacitances(labels)[1])
+            n_pending += points.shape[0]
+            if n_pending >= chunk_size:
+                points, capacitances = np.vstack(pending_points), np.concatenate(pending_capacitances)
+                for offset in range(0, n_pending - chunk_size + 1, chunk_size):
+                    yield points[offset:offset + chunk_size], capacitances[offset:offset + chunk_size]
+                rest = n_pending - n_pending % chunk_size
+                pending_points, pending_capacitances = [points[rest:]], [capacitances[rest:]]
+                n_pending -= rest
+        if n_pending:
+            yield np.vstack(pending_points), np.concatenate(pending_capacitances)
 
-    def extract_coordinates(self):
-        """Extract coordinates and match with capacitance values"""
+    def extract_columns(self, workers=None):
+        """Extract coordinates and match with capacitance values, returned as a columnar SinkData
+
+        Large coordinate files are parsed in parallel (see parse_coordinate_file) and the sinks are
+        joined with the SPEF tables as whole arrays rather than one dictionary probe per sink.
+        """
         try:
-            # First get the label to ID mapping
-            self.extract_label_mapping()
-            
-            # Then get the capacitance values
-            self.extract_capacitances()
+            # Get the label to ID mapping and the capacitance values in a single pass
+            self.parse_capacitance_file()
             
             # Now extract coordinates and match with capacitances
-            with open(self.coord_file, 'r') as file:
-                text = file.read()
+            labels, points = parse_coordinate_file(self.coord_file, workers)
+            numeric_ids, capacitances = self.join_capacitances(labels)
 
-            pattern = r"^(.*?)\s*:\s*X\s*=\s*{([\d.]+),\s*Y\s*=\s*([\d.]+)}"
-            matches = re.findall(pattern, text, re.MULTILINE)
-            
-            for label, x, y in matches:
-                label = label.strip()
-                numeric_id = self.label_to_id.get(label)
-                
-                # Try to get capacitance using different possible keys
-                capacitance = 0.0
-                if numeric_id:
-                    # Try with just the numeric ID
-                    capacitance = self.capacitances.get(numeric_id, 0.0)
-                    # If not found, try with common suffixes
-                    if capacitance == 0.0:
-                        for suffix in [':A', ':Q', ':Z', ':Y']:
-                            full_id = f"{numeric_id}{suffix}"
-                            if full_id in self.capacitances:
-                                capacitance = self.capacitances[full_id]
-                                break
-                
-                self.xy_values.append({
-                    "label": label,
-                    "x": float(x),
-                    "y": float(y),
-                    "numeric_id": numeric_id,
-                    "capacitance": capacitance
-                })
-            
-            print(f"Total coordinates extracted: {len(self.xy_values)}")
-            return self.xy_values
+            label_table, label_codes = _factorize(labels)
+            sinks = SinkData(points, capacitances, label_codes, _decode(label_table), _decode(numeric_ids))
+            print(f"Total coordinates extracted: {len(sinks)}")
+            return sinks
 
         except FileNotFoundError:
             print(f"❌ Error: Coordinate file not found at path: {self.coord_file}")
-            return []
+            return SinkData.empty()
 
-            
-            
+    def extract_coordinates(self):
+        """Extract coordinates as a list of dictionaries (one per sink); prefer extract_columns"""
+        self.xy_values = self.extract_columns().to_records()
+        return self.xy_values
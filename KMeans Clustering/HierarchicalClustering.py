@@ -0,0 +1,210 @@
+import json
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import numpy as np
+from KMeansClusteringHelper import DEFAULT_BLOCK_BYTES, as_points
+from WeightedKMeansClustering import WeightedKMeansClustering
+
+
+class ClusterNode:
+    """One cluster of the clock tree; its sinks are order[start:end] of the HierarchicalClustering that built it"""
+
+    def __init__(self, start, end, level=0, path=(), parent=None):
+        self.start = start
+        self.end = end
+        self.level = level  # 0 for the root, which holds every sink
+        self.path = path  # Child indices from the root down to this node
+        self.parent = parent
+        self.children = []
+        self.centroid = None  # Weighted mean of the node's sinks
+        self.capacitance = None  # Summed capacitance of the node's sinks
+
+    @property
+    def n_sinks(self):
+        return self.end - self.start
+
+    @property
+    def is_leaf(self):
+        return not self.children
+
+    def walk(self):
+        """This node and all its descendants, depth first, parents before children"""
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(node.children))
+
+    def leaves(self):
+        return [node for node in self.walk() if node.is_leaf]
+
+
+class HierarchicalClustering:
+    """Recursive clustering for multi-level clock trees
+
+    The sinks are split into branching clusters with WeightedKMeansClustering, and every cluster
+    is split again until it has at most max_sinks sinks and max_capacitance summed capacitance
+    (either may be None), or reaches max_depth. After a split the node's range of the sink
+    arrays is reordered so every child is a contiguous range, so each subproblem works on a view
+    of the parent's arrays and the tree only stores (start, end) ranges into the permutation
+    order. Independent subtrees are split in parallel on n_jobs threads (the distance kernels
+    release the GIL); every node has its own seed derived from its path, so the tree does not
+    depend on n_jobs.
+    """
+
+    def __init__(self, branching=4, max_sinks=None, max_capacitance=None, max_depth=8, max_iterations=100,
+                 random_state=42, block_bytes=DEFAULT_BLOCK_BYTES, dtype=np.float64, algorithm='lloyd',
+                 init='k-means++', n_jobs=1, metric='sqeuclidean'):
+        if branching < 2:
+            raise ValueError(f"branching must be at least 2, got {branching}")
+        self.branching = branching  # Children per split
+        self.max_sinks = max_sinks  # Leaf target: most sinks per leaf cluster, or None
+        self.max_capacitance = max_capacitance  # Leaf target: most summed capacitance per leaf cluster, or None
+        self.max_depth = max_depth  # Nodes at this level are leaves whatever their size
+        self.max_iterations = max_iterations
+        self.random_state = random_state  # Base seed; each node's fit is seeded with it plus the node's path
+        self.block_bytes = block_bytes  # Memory budget for one block of the distance computation
+        self.dtype = dtype  # float64, or float32 to halve memory traffic on very large inputs
+        self.algorithm = algorithm  # Algorithm of the per-node WeightedKMeansClustering
+        self.init = init  # Seeding of the per-node WeightedKMeansClustering
+        self.n_jobs = n_jobs  # Threads splitting independent subtrees
+        self.metric = metric  # Metric of the per-node WeightedKMeansClustering
+        self.weights = None
+        self.root = None
+        self.order = None  # Permutation of the sinks: node.start:node.end of it are the node's sinks
+        self.points = None  # The sinks in that order
+        self.capacitances = None  # Their capacitances in that order
+        self.fit_weights = None  # The weights each node is clustered with, in that order
+
+    def set_weights(self, weights):
+        """Set the capacitances to cluster with and to check against max_capacitance (or a SinkData table)"""
+        weights = getattr(weights, 'capacitances', weights)
+        self.weights = np.array(weights, dtype=np.float64)
+
+    def _is_leaf(self, node):
+        if node.level >= self.max_depth or node.n_sinks < self.branching:
+            return True
+        if self.max_sinks is not None and node.n_sinks > self.max_sinks:
+            return False
+        if self.max_capacitance is not None and node.capacitance > self.max_capacitance:
+            return False
+        return self.max_sinks is not None or self.max_capacitance is not None
+
+    def _summarize(self, node):
+        capacitances = self.capacitances[node.start:node.end]
+        node.capacitance = float(np.sum(capacitances))
+        weights = np.where(capacitances > 0, capacitances, 0.0)
+        points = self.points[node.start:node.end]
+        if np.sum(weights) > 0:
+            node.centroid = np.average(points, axis=0, weights=weights)
+        else:
+            node.centroid = np.mean(points, axis=0)
+
+    def _split(self, node):
+        """Cluster one node's sinks, reorder its range by child and return the children to split next"""
+        points = self.points[node.start:node.end]
+        capacitances = self.capacitances[node.start:node.end]
+        fit_weights = self.fit_weights[node.start:node.end]
+        model = WeightedKMeansClustering(k=self.branching, max_iterations=self.max_iterations,
+                                         random_state=[self.random_state, *node.path], block_bytes=self.block_bytes,
+                                         dtype=self.dtype, algorithm=self.algorithm, init=self.init,
+                                         metric=self.metric)
+        model.set_weights(fit_weights)
+        labels = model.fit(points)
+
+        counts = np.bincount(labels, minlength=self.branching)
+        if np.count_nonzero(counts) < 2:
+            # The sinks cannot be told apart (e.g. all at one location), so this stays a leaf
+            return []
+
+        # Group the range by child; the other nodes' ranges are untouched, so threads do not collide
+        by_child = np.argsort(labels, kind='stable')
+        points[:] = points[by_child]
+        capacitances[:] = capacitances[by_child]
+        fit_weights[:] = fit_weights[by_child]
+        self.order[node.start:node.end] = self.order[node.start:node.end][by_child]
+
+        ends = node.start + np.cumsum(counts)
+        starts = ends - counts
+        for child_index, (start, end) in enumerate(zip(starts[counts > 0], ends[counts > 0])):
+            child = ClusterNode(int(start), int(end), node.level + 1, node.path + (child_index,), node)
+            self._summarize(child)
+            node.children.append(child)
+        return [child for child in node.children if not self._is_leaf(child)]
+
+    def fit(self, data_points):
+        """Build the tree; returns the root ClusterNode"""
+        if self.weights is None:
+            raise ValueError("Weights must be set before fitting. Use set_weights() method.")
+        if self.max_sinks is None and self.max_capacitance is None:
+            raise ValueError("Set max_sinks or max_capacitance so the recursion knows when to stop.")
+        if self.max_capacitance is not None and np.max(self.weights) > self.max_capacitance:
+            print("Warning: Some sinks alone exceed max_capacitance. Their leaves will too.")
+
+        # One copy in tree order; every node from here on works on a range of it
+        self.order = np.arange(self.weights.shape[0])
+        self.points = np.array(as_points(data_points, self.dtype))
+        self.capacitances = np.array(self.weights)
+        # Unknown (zero) capacitances get a small positive weight once, for the whole design, so a
+        # subtree where every capacitance is unknown still has weights to cluster with
+        self.fit_weights = np.array(self.weights)
+        positive = self.fit_weights > 0
+        if not np.all(positive):
+            print("Warning: Found zero or negative weights. Converting to small positive values.")
+            self.fit_weights[~positive] = np.min(self.fit_weights[positive]) * 0.1 if np.any(positive) else 1.0
+        if self.points.shape[0] != self.capacitances.shape[0]:
+            raise ValueError("There must be one weight per data point.")
+        self.root = ClusterNode(0, self.points.shape[0])
+        self._summarize(self.root)
+        if self._is_leaf(self.root):
+            return self.root
+
+        if self.n_jobs == 1:
+            pending = [self.root]
+            while pending:
+                pending.extend(self._split(pending.pop()))
+            return self.root
+
+        with ThreadPoolExecutor(max_workers=self.n_jobs) as pool:
+            running = {pool.submit(self._split, self.root)}
+            while running:
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    running.update(pool.submit(self._split, child) for child in future.result())
+        return self.root
+
+    def labels(self, level=None):
+        """Flat labels in the input order: the leaf (or, with level, the node at that level) of each sink
+
+        Nodes are numbered in depth-first order.
+        """
+        labels = np.empty(self.order.shape[0], dtype=np.intp)
+        nodes = [node for node in self.root.walk()
+                 if (node.is_leaf and (level is None or node.level <= level)) or node.level == level]
+        for label, node in enumerate(nodes):
+            labels[self.order[node.start:node.end]] = label
+        return labels
+
+    def save_tree(self, filename, names=None):
+        """Write the tree as JSON: every node with its level, centroid, sink count and capacitance,
+        and every leaf with its sinks (indices into the input, or the given sink names)"""
+        def as_dict(node):
+            entry = {
+                "level": node.level,
+                "centroid": [float(value) for value in node.centroid],
+                "sinks": node.n_sinks,
+                "capacitance": node.capacitance,
+            }
+            if node.is_leaf:
+                members = self.order[node.start:node.end]
+                entry["members"] = ([str(names[i]) for i in members] if names is not None
+                                    else [int(i) for i in members])
+            else:
+                entry["children"] = [as_dict(child) for child in node.children]
+            return entry
+
+        try:
+            with open(filename, 'w') as f:
+                json.dump(as_dict(self.root), f, indent=1)
+            print(f"Successfully saved cluster tree to {filename}")
+        except Exception as e:
+            print(f"Error saving cluster tree: {e}")
@@ -0,0 +1,83 @@
+import numpy as np
+from KMeansClusteringHelper import DEFAULT_BLOCK_BYTES, weighted_lloyd
+
+
+class SinkDelta:
+    """An ECO change to a clustered sink set
+
+    removed and moved are indices into the previous sinks; moved_points are the new positions of
+    the moved sinks and moved_capacitances (optional) their new capacitances. added_points and
+    added_capacitances describe new sinks, which are appended after the remaining ones.
+    """
+
+    def __init__(self, added_points=None, added_capacitances=None, removed=None, moved=None, moved_points=None,
+                 moved_capacitances=None):
+        self.added_points = np.empty((0, 2)) if added_points is None else np.asarray(added_points, dtype=np.float64)
+        self.added_capacitances = (np.ones(self.added_points.shape[0]) if added_capacitances is None
+                                   else np.asarray(added_capacitances, dtype=np.float64))
+        self.removed = np.empty(0, dtype=np.intp) if removed is None else np.asarray(removed, dtype=np.intp)
+        self.moved = np.empty(0, dtype=np.intp) if moved is None else np.asarray(moved, dtype=np.intp)
+        self.moved_points = (np.empty((0, self.added_points.shape[1])) if moved_points is None
+                             else np.asarray(moved_points, dtype=np.float64))
+        self.moved_capacitances = None if moved_capacitances is None else np.asarray(moved_capacitances, dtype=np.float64)
+
+        if self.added_capacitances.shape != (self.added_points.shape[0],):
+            raise ValueError("added_capacitances must have one value per added sink")
+        if self.moved_points.shape[0] != self.moved.size:
+            raise ValueError("moved_points must have one row per moved sink")
+        if self.moved_capacitances is not None and self.moved_capacitances.shape != (self.moved.size,):
+            raise ValueError("moved_capacitances must have one value per moved sink")
+        if np.intersect1d(self.removed, self.moved).size:
+            raise ValueError("A sink cannot be both removed and moved")
+
+
+def apply_delta(data_points, weights, labels, delta):
+    """New points, weights and labels after an ECO, plus the previous -> new index map
+
+    weights are in the same units as the delta's capacitances. Moved and added sinks get label
+    -1 (not assigned yet); removed sinks map to index -1.
+    """
+    n_points = data_points.shape[0]
+    points = np.array(data_points, dtype=np.float64)
+    weights = np.array(weights, dtype=np.float64)
+    labels = np.array(labels, dtype=np.intp)
+    points[delta.moved] = delta.moved_points
+    if delta.moved_capacitances is not None:
+        weights[delta.moved] = delta.moved_capacitances
+    labels[delta.moved] = -1
+
+    keep = np.ones(n_points, dtype=bool)
+    keep[delta.removed] = False
+    index_map = np.full(n_points, -1, dtype=np.intp)
+    index_map[keep] = np.arange(np.count_nonzero(keep))
+
+    points = np.vstack([points[keep], delta.added_points])
+    weights = np.concatenate([weights[keep], delta.added_capacitances])
+    labels = np.concatenate([labels[keep], np.full(delta.added_points.shape[0], -1, dtype=np.intp)])
+    return points, weights, labels, index_map
+
+
+def update_clusters(data_points, weights, centroids, labels, delta, max_iterations=100,
+                    block_bytes=DEFAULT_BLOCK_BYTES):
+    """Apply an ECO delta to a converged clustering and re-converge from its centroids
+
+    The weighted Lloyd iterations restart from the previous centroids with Hamerly's bounds, so
+    after the first pass only points near a centroid that actually moves (the clusters that
+    gained or lost sinks, and whatever they ripple into) get their distances recomputed.
+    Returns (points, weights, labels, centroids, changed, index_map): the updated sinks (remaining
+    ones in their previous order, then the added ones), their labels and the new centroids, the
+    new indices of remaining sinks whose cluster changed, and the previous -> new index map.
+    """
+    labels = np.asarray(labels)
+    points, weights, _, index_map = apply_delta(data_points, weights, labels, delta)
+    non_positive = weights <= 0
+    if np.any(non_positive):
+        # Same treatment as WeightedKMeansClustering.set_weights
+        print("Warning: Found zero or negative weights. Converting to small positive values.")
+        weights[non_positive] = np.min(weights[~non_positive]) * 0.1
+    new_labels, centroids, _ = weighted_lloyd(points, weights, centroids, max_iterations, block_bytes,
+                                              algorithm='hamerly')
+
+    kept = np.flatnonzero(index_map >= 0)
+    changed = index_map[kept][new_labels[index_map[kept]] != labels[kept]]
+    return points, weights, new_labels, centroids, changed, index_map
@@ -1,56 +1,809 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
 import numpy as np
 
-class KMenasClustering:
-    def __init__(self, k=3, max_iter=100, random_state=42):
+# Default memory budget for one block of the (points x centroids x features) difference tensor
+DEFAULT_BLOCK_BYTES = 64 * 1024 * 1024
+
+
+def block_rows(n_centroids, n_features, itemsize=8, block_bytes=DEFAULT_BLOCK_BYTES):
+    """Number of points per block so that one block of differences stays within block_bytes"""
+    return max(1, int(block_bytes // max(1, n_centroids * n_features * itemsize)))
+
+
+def as_points(data_points, dtype=np.float64):
+    """Return the points as a C-contiguous array of the given dtype, copying only if needed
+
+    Accepts a SinkData table from FileReader as well as any array-like of coordinates.
+    """
+    data_points = getattr(data_points, 'points', data_points)
+    return np.ascontiguousarray(data_points, dtype=dtype)
+
+
+def assign_labels(data_points, centroids, block_bytes=DEFAULT_BLOCK_BYTES, out=None, metric='sqeuclidean'):
+    """Assign every point to its nearest centroid, a block of points at a time"""
+    n_points = data_points.shape[0]
+    if out is None:
+        out = np.empty(n_points, dtype=np.intp)
+
+    centroids = np.asarray(centroids, dtype=data_points.dtype)
+    rows = block_rows(centroids.shape[0], centroids.shape[1], data_points.itemsize, block_bytes)
+    for start in range(0, n_points, rows):
+        out[start:start + rows] = _nearest(data_points[start:start + rows], centroids, metric)
+    return out
+
+
+def _squared_distance_matrix(block, centroids):
+    # Accumulating one feature at a time keeps the temporaries at (block x centroids)
+    distances = (block[:, 0, np.newaxis] - centroids[np.newaxis, :, 0]) ** 2
+    for j in range(1, block.shape[1]):
+        distances += (block[:, j, np.newaxis] - centroids[np.newaxis, :, j]) ** 2
+    return distances
+
+
+def _nearest(block, centroids, metric='sqeuclidean'):
+    if metric == 'manhattan':
+        return np.argmin(distance_matrix(block, centroids, metric), axis=1)
+    # Squared distances have the same argmin as the euclidean distances, so skip the sqrt
+    return np.argmin(_squared_distance_matrix(block, centroids), axis=1)
+
+
+# Names accepted by the clustering classes' metric option. 'sqeuclidean' and 'euclidean' assign
+# points alike and move centroids to the weighted mean, but score a fit by the sum of squared and
+# of plain distances respectively; 'manhattan' (L1, the length of a rectilinear route) moves
+# each centroid to the coordinate-wise weighted median of its points instead (K-medians)
+METRICS = ('sqeuclidean', 'euclidean', 'manhattan')
+
+
+def check_metric(metric, algorithm='lloyd'):
+    """Raise ValueError for an unknown metric or one the algorithm cannot use"""
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric {metric!r}; expected one of {', '.join(METRICS)}")
+    if metric == 'manhattan' and algorithm != 'lloyd':
+        # Hamerly's bounds and the mini-batch mean updates are euclidean
+        raise ValueError(f"metric='manhattan' only supports algorithm='lloyd', got {algorithm!r}")
+
+
+def distance_matrix(block, centroids, metric='sqeuclidean'):
+    """(block x centroids) distances in the given metric"""
+    if metric == 'manhattan':
+        distances = np.abs(block[:, 0, np.newaxis] - centroids[np.newaxis, :, 0])
+        for j in range(1, block.shape[1]):
+            distances += np.abs(block[:, j, np.newaxis] - centroids[np.newaxis, :, j])
+        return distances
+    distances = _squared_distance_matrix(block, centroids)
+    return np.sqrt(distances, out=distances) if metric == 'euclidean' else distances
+
+
+def _row_distances(diff, metric='sqeuclidean'):
+    """Length of every row of diff in the given metric"""
+    if metric == 'manhattan':
+        return np.sum(np.abs(diff), axis=1)
+    distances = np.einsum('ij,ij->i', diff, diff)
+    return np.sqrt(distances) if metric == 'euclidean' else distances
+
+
+def weighted_medians(data_points, labels, weights, centroids):
+    """Coordinate-wise weighted median of each cluster; empty clusters keep their previous centroid
+
+    The median minimizes the weighted L1 distance of a cluster's points, as the mean does the
+    squared distance. One stable sort per coordinate orders the values within every cluster at
+    once; each cluster's median is the first value where its cumulative weight reaches half the
+    cluster weight (the lower median).
+    """
+    k = centroids.shape[0]
+    weights = np.ones(data_points.shape[0]) if weights is None else weights
+    weight_sums = np.bincount(labels, weights=weights, minlength=k)
+    non_empty = np.flatnonzero(weight_sums > 0)
+    new_centroids = np.array(centroids, dtype=np.float64)
+    for j in range(data_points.shape[1]):
+        order = np.lexsort((data_points[:, j], labels))
+        sorted_labels = labels[order]
+        starts = np.searchsorted(sorted_labels, non_empty)
+        ends = np.searchsorted(sorted_labels, non_empty, side='right')
+        cumulative = np.cumsum(weights[order])
+        before = np.concatenate([[0.0], cumulative])[starts]
+        middle = np.searchsorted(cumulative, before + 0.5 * weight_sums[non_empty])
+        # Rounding in the running sum must not push the median out of its cluster
+        middle = np.clip(middle, starts, ends - 1)
+        new_centroids[non_empty, j] = data_points[order[middle], j]
+    return new_centroids
+
+
+def _reduce_block(block, block_labels, block_weights, sums, weight_sums):
+    """Add one block's (weighted) coordinate sums and weights per cluster into sums and weight_sums"""
+    k = sums.shape[0]
+    weight_sums += np.bincount(block_labels, weights=block_weights, minlength=k)
+    for j in range(block.shape[1]):
+        column = block[:, j] if block_weights is None else block[:, j] * block_weights
+        sums[:, j] += np.bincount(block_labels, weights=column, minlength=k)
+
+
+def assign_and_reduce(data_points, centroids, labels, weights=None, block_bytes=DEFAULT_BLOCK_BYTES,
+                      metric='sqeuclidean'):
+    """Single pass over the points that assigns labels in place and accumulates per-cluster sums
+
+    Returns the number of labels that changed, the (weighted) coordinate sums per cluster and
+    the total weight per cluster (the point count when weights is None). Sums are always
+    accumulated in float64, whatever the dtype of the points.
+    """
+    k, n_features = centroids.shape
+    n_points = data_points.shape[0]
+    centroids = np.asarray(centroids, dtype=data_points.dtype)
+    sums = np.zeros((k, n_features), dtype=np.float64)
+    weight_sums = np.zeros(k, dtype=np.float64)
+    n_changed = 0
+
+    rows = block_rows(k, n_features, data_points.itemsize, block_bytes)
+    for start in range(0, n_points, rows):
+        block = data_points[start:start + rows]
+        block_labels = _nearest(block, centroids, metric)
+        n_changed += np.count_nonzero(labels[start:start + rows] != block_labels)
+        labels[start:start + rows] = block_labels
+
+        block_weights = None if weights is None else weights[start:start + rows]
+        _reduce_block(block, block_labels, block_weights, sums, weight_sums)
+
+    return n_changed, sums, weight_sums
+
+
+class HamerlyAssigner:
+    """Drop-in replacement for assign_and_reduce that skips most distance computations
+
+    Keeps, per point, an upper bound on the distance to its assigned centroid and a lower bound
+    on the distance to any other centroid (Hamerly's algorithm). After the centroids move the
+    bounds are loosened by how far the centroids moved; a point whose upper bound is still below
+    both its lower bound and half the distance from its centroid to the nearest other centroid
+    cannot change cluster, so its distances are not computed at all. Only the remaining points
+    get an exact distance row. Pruning is strict and padded for rounding, and the sums are
+    reduced block by block exactly like assign_and_reduce, so labels and centroids are identical
+    to the plain Lloyd iteration. One instance follows one fit.
+    """
+
+    # Relative slack on the bounds so floating-point rounding can never prune a point wrongly
+    _SLACK = 1e-9
+
+    def __init__(self):
+        self.upper = None
+        self.lower = None
+        self.previous_centroids = None
+
+    def _exact(self, block, centroids):
+        """Labels plus distances to the closest and second closest centroid for a block of points"""
+        distances = _squared_distance_matrix(block, centroids)
+        block_labels = np.argmin(distances, axis=1)
+        rows = np.arange(block.shape[0])
+        closest = distances[rows, block_labels]
+        if centroids.shape[0] > 1:
+            distances[rows, block_labels] = np.inf
+            second = np.min(distances, axis=1)
+        else:
+            second = np.full(block.shape[0], np.inf)
+        return block_labels, np.sqrt(closest), np.sqrt(second)
+
+    def __call__(self, data_points, centroids, labels, weights=None, block_bytes=DEFAULT_BLOCK_BYTES):
+        k, n_features = centroids.shape
+        n_points = data_points.shape[0]
+        centroids = np.asarray(centroids, dtype=data_points.dtype)
+        sums = np.zeros((k, n_features), dtype=np.float64)
+        weight_sums = np.zeros(k, dtype=np.float64)
+        n_changed = 0
+
+        first_call = self.upper is None
+        if first_call:
+            self.upper = np.empty(n_points)
+            self.lower = np.empty(n_points)
+        else:
+            # Loosen the bounds by how far each centroid moved since the last call
+            shifts = np.sqrt(np.sum((centroids.astype(np.float64) - self.previous_centroids) ** 2, axis=1))
+            order = np.argsort(shifts)
+            largest = shifts[order[-1]]
+            second_largest = shifts[order[-2]] if k > 1 else 0.0
+            # For points of the fastest centroid the other centroids moved at most second_largest
+            self.upper += shifts[labels]
+            self.lower -= np.where(labels == order[-1], second_largest, largest)
+            # Half the distance from each centroid to its nearest other centroid
+            between = _squared_distance_matrix(centroids, centroids)
+            np.fill_diagonal(between, np.inf)
+            half_gap = 0.5 * np.sqrt(np.min(between, axis=1)) if k > 1 else np.full(1, np.inf)
+        self.previous_centroids = np.array(centroids, dtype=np.float64)
+
+        rows = block_rows(k, n_features, data_points.itemsize, block_bytes)
+        for start in range(0, n_points, rows):
+            stop = min(start + rows, n_points)
+            block = data_points[start:stop]
+            block_labels = np.array(labels[start:stop], dtype=np.intp)
+            upper = self.upper[start:stop]
+            lower = self.lower[start:stop]
+
+            if first_call:
+                new_labels, upper[:], lower[:] = self._exact(block, centroids)
+            else:
+                bound = np.maximum(half_gap[block_labels], lower) * (1 - self._SLACK)
+                candidates = np.flatnonzero(upper * (1 + self._SLACK) >= bound)
+                if candidates.size:
+                    # Tighten the upper bound with the exact distance to the current centroid
+                    diff = block[candidates] - centroids[block_labels[candidates]]
+                    upper[candidates] = np.sqrt(np.einsum('ij,ij->i', diff, diff))
+                    candidates = candidates[upper[candidates] * (1 + self._SLACK) >= bound[candidates]]
+                new_labels = block_labels
+                if candidates.size:
+                    new_labels = block_labels.copy()
+                    new_labels[candidates], upper[candidates], lower[candidates] = self._exact(block[candidates], centroids)
+
+            n_changed += np.count_nonzero(block_labels != new_labels)
+            labels[start:stop] = new_labels
+
+            block_weights = None if weights is None else weights[start:stop]
+            _reduce_block(block, new_labels, block_weights, sums, weight_sums)
+
+        return n_changed, sums, weight_sums
+
+
+def make_assigner(algorithm='lloyd', metric='sqeuclidean'):
+    """Assignment step for a Lloyd loop: plain blocked distances, or Hamerly's bounds for large K"""
+    if algorithm == 'hamerly':
+        return HamerlyAssigner()
+    if metric == 'manhattan':
+        return partial(assign_and_reduce, metric=metric)
+    return assign_and_reduce
+
+
+def centroids_from_sums(sums, weight_sums, centroids):
+    """Weighted mean of each cluster; empty clusters keep their previous centroid"""
+    new_centroids = np.array(centroids, dtype=np.float64)
+    non_empty = weight_sums > 0
+    new_centroids[non_empty] = sums[non_empty] / weight_sums[non_empty, np.newaxis]
+    return new_centroids
+
+
+def label_buffer(n_points, out=None):
+    """Zeroed label array, reusing a preallocated (possibly memory-mapped) output when given"""
+    if out is None:
+        return np.zeros(n_points, dtype=np.intp)
+    if out.shape != (n_points,):
+        raise ValueError(f"Label output has shape {out.shape}, expected ({n_points},)")
+    out[:] = 0
+    return out
+
+
+class FitCancelled(Exception):
+    """Raised by a progress callback to abandon the fit it is reporting on"""
+
+
+def _weighted_square_norm(data_points, weights=None, block_bytes=DEFAULT_BLOCK_BYTES):
+    """Sum of (weighted) squared norms of the points, the constant term of the inertia"""
+    rows = block_rows(1, data_points.shape[1], 8, block_bytes)
+    total = 0.0
+    for start in range(0, data_points.shape[0], rows):
+        block = np.asarray(data_points[start:start + rows], dtype=np.float64)
+        norms = np.einsum('ij,ij->i', block, block)
+        total += np.sum(norms if weights is None else norms * weights[start:start + rows])
+    return float(total)
+
+
+def weighted_lloyd(data_points, weights, centroids, max_iterations=100, block_bytes=DEFAULT_BLOCK_BYTES, out=None,
+                   algorithm='lloyd', shift_tol=None, callback=None, metric='sqeuclidean'):
+    """Lloyd iterations shared by all three K-means classes
+
+    Points are assigned to the nearest centroid (a positive per-point weight scales all of a
+    point's distances equally, so it does not change the argmin) and centroids move to the
+    weighted mean of their points. Stops once no label changes, or with shift_tol (the
+    KMenasClustering criterion) once no centroid coordinate drops by shift_tol or more, keeping
+    the previous centroids. Labels are written into out when it is given; algorithm='hamerly'
+    prunes distance computations with the same result. With metric='manhattan' points go to the
+    nearest centroid in L1 and centroids to the weighted median of their points (K-medians).
+
+    callback(iteration, shift, inertia) is called after every iteration with the largest centroid
+    move and the inertia of the new labels around the moved centroids (from the cluster sums, so
+    it costs no extra pass); it may raise FitCancelled to stop the fit.
+    Returns (labels, centroids, n_iterations).
+    """
+    check_metric(metric, algorithm)
+    centroids = np.array(centroids, dtype=np.float64)
+    labels = label_buffer(data_points.shape[0], out)
+    assign = make_assigner(algorithm, metric)
+    if callback is not None and metric == 'sqeuclidean':
+        square_norm = _weighted_square_norm(data_points, weights, block_bytes)
+
+    n_iterations = 0
+    for n_iterations in range(1, max_iterations + 1):
+        n_changed, sums, weight_sums = assign(data_points, centroids, labels, weights, block_bytes)
+        if metric == 'manhattan':
+            new_centroids = weighted_medians(data_points, labels, weights, centroids)
+        else:
+            new_centroids = centroids_from_sums(sums, weight_sums, centroids)
+
+        if callback is not None:
+            shift = np.sqrt(np.max(np.sum((new_centroids - centroids) ** 2, axis=1)))
+            if metric == 'sqeuclidean':
+                non_empty = weight_sums > 0
+                cost = square_norm - np.sum(np.sum(sums[non_empty] ** 2, axis=1) / weight_sums[non_empty])
+            else:
+                cost = inertia(data_points, new_centroids, labels, weights, block_bytes, metric)
+            callback(n_iterations, float(shift), max(float(cost), 0.0))
+
+        if shift_tol is not None:
+            if np.max(centroids - new_centroids) < shift_tol:
+                break
+            centroids = new_centroids
+            continue
+
+        centroids = new_centroids
+        # Check for convergence
+        if n_changed == 0:
+            break
+
+    return labels, centroids, n_iterations
+
+
+# From this many centroids on, predict_labels finds the nearest one with a KD-tree instead of
+# computing the distance to every centroid
+KDTREE_MIN_CENTROIDS = 32
+
+
+def _fitted(centroids):
+    if centroids is None:
+        raise ValueError("The model must be fitted first.")
+    return np.asarray(centroids, dtype=np.float64)
+
+
+def predict_labels(data_points, centroids, block_bytes=DEFAULT_BLOCK_BYTES, out=None, metric='sqeuclidean'):
+    """Nearest fitted centroid for every point, a block of points at a time
+
+    With KDTREE_MIN_CENTROIDS or more centroids each block is looked up in a KD-tree over the
+    centroids, O(log K) per point instead of O(K). The two nearest are looked up so that points
+    exactly between centroids (common in L1 on a placement grid) are found and assigned with the
+    brute-force argmin over all centroids, which gives them the lowest tied index. Labels are
+    written into out when it is given.
+    """
+    centroids = _fitted(centroids)
+    check_metric(metric)
+    if centroids.shape[0] < KDTREE_MIN_CENTROIDS:
+        return assign_labels(data_points, centroids, block_bytes, out, metric)
+
+    # Imported here so that the fitting code, and the command line, start without scipy
+    from scipy.spatial import cKDTree
+    n_points = data_points.shape[0]
+    if out is None:
+        out = np.empty(n_points, dtype=np.intp)
+    tree = cKDTree(centroids)
+    rows = block_rows(1, data_points.shape[1], data_points.itemsize, block_bytes)
+    for start in range(0, n_points, rows):
+        block = data_points[start:start + rows]
+        distances, nearest = tree.query(block, k=2, p=1 if metric == 'manhattan' else 2)
+        labels = nearest[:, 0]
+        tied = distances[:, 0] == distances[:, 1]
+        if np.any(tied):
+            # More than two centroids may be tied, so these rows are compared against all of them
+            labels[tied] = assign_labels(block[tied], centroids, block_bytes, metric=metric)
+        out[start:start + rows] = labels
+    return out
+
+
+def centroid_distances(data_points, centroids, block_bytes=DEFAULT_BLOCK_BYTES, out=None, metric='sqeuclidean'):
+    """(points x centroids) distances in the given metric, a block of points at a time
+
+    out may be a preallocated (e.g. memory-mapped) float array for inputs whose distance table
+    does not fit in memory.
+    """
+    centroids = _fitted(centroids)
+    check_metric(metric)
+    n_points = data_points.shape[0]
+    if out is None:
+        out = np.empty((n_points, centroids.shape[0]))
+    centroids = centroids.astype(data_points.dtype)
+    rows = block_rows(centroids.shape[0], centroids.shape[1], data_points.itemsize, block_bytes)
+    for start in range(0, n_points, rows):
+        out[start:start + rows] = distance_matrix(data_points[start:start + rows], centroids, metric)
+    return out
+
+
+def save_model(model, filename):
+    """Write a fitted model's centroids and settings to an .npz file
+
+    Settings are the model's scalar attributes (K, metric, seed, ...); per-sink arrays such as
+    the weights are not kept, so a loaded model can predict but not update.
+    """
+    centroids = _fitted(model.centroids)
+    settings = {}
+    for name, value in vars(model).items():
+        if name == 'dtype':
+            value = np.dtype(value).name
+        elif isinstance(value, np.generic):
+            value = value.item()
+        if isinstance(value, (bool, int, float, str, type(None))):
+            settings[name] = value
+    # Write to a temporary file and rename it so a reader never sees a partial model
+    tmp_path = f"{filename}.tmp{os.getpid()}.npz"
+    np.savez(tmp_path, centroids=centroids, model=np.array(type(model).__name__),
+             settings=np.array(json.dumps(settings)))
+    os.replace(tmp_path, filename)
+
+
+def load_model(cls, filename):
+    """A cls instance with the centroids and settings saved by save_model"""
+    with np.load(filename) as stored:
+        name = str(stored["model"])
+        if name != cls.__name__:
+            raise ValueError(f"{filename} holds a {name}, not a {cls.__name__}")
+        centroids = stored["centroids"]
+        settings = json.loads(str(stored["settings"]))
+    model = cls()
+    for name, value in settings.items():
+        setattr(model, name, value)
+    model.dtype = np.dtype(model.dtype).type
+    model.centroids = centroids
+    return model
+
+
+class CentroidModel:
+    """Settings and fitted state shared by the centroid-based clustering classes
+
+    Once fitted, a model labels new points by their nearest centroid, measures their distances to
+    every centroid and can be saved to and loaded from an .npz file.
+    """
+
+    def __init__(self, k, random_state, block_bytes, dtype, init, metric='sqeuclidean'):
         self.k = k
-        self.max_iter = max_iter
         self.centroids = None
-        self.random_state = random_state
-        np.random.seed(random_state)  # Set random seed for reproducibility
+        self.n_iterations = None  # Iterations (or mini-batch steps) the last fit took
+        self.inertia = None  # (Weighted) objective of the kept restart of the last fit
+        self.random_state = random_state  # Base seed; every restart gets its own generator derived from it
+        self.block_bytes = block_bytes  # Memory budget for one block of the distance computation
+        self.dtype = dtype  # float64, or float32 to halve memory traffic on very large inputs
+        self.init = init  # Seeding: 'uniform', 'k-means++' or 'k-means||'
+        self.metric = metric  # 'sqeuclidean', 'euclidean' or 'manhattan' (K-medians, lloyd only)
 
-    @staticmethod
-    def euclidean_distance(data_point,centroids): #Calculate the distance between a data point and all centroids and return an array of distances
-        return np.sqrt(np.sum((centroids - data_point)**2, axis=1))
-    
-    def fit(self, date_points):
-        # Convert input to numpy array if it's not already
-        date_points = np.array(date_points)
-        
-        # Reset random seed before each fit to ensure same initial centroids
-        np.random.seed(self.random_state)
-        
-        self.centroids = np.random.uniform(np.amin(date_points,axis=0),np.amax(date_points,axis=0),size=(self.k,date_points.shape[1])) #Set bounds for the initial centroids by using the min and max values of the data points
-
-        for _ in range(self.max_iter):
-            y = []
-
-            for data_point in date_points:
-                distances = KMenasClustering.euclidean_distance(data_point,self.centroids)
-                cluster_index = np.argmin(distances) #Assign the data point to the cluster with the smallest distance
-                y.append(cluster_index)
-
-            y = np.array(y)
-
-            cluster_indices = []
-            for i in range(self.k):
-                cluster_indices.append(np.argwhere(y==i)) #Find the indices of the data points that belong to each cluster
-
-            cluster_centers = []
-            for i , indices in enumerate(cluster_indices):
-                if len(indices) > 0:
-                    cluster_centers.append(np.mean(date_points[indices],axis=0)[0])
-                else:
-                    cluster_centers.append(self.centroids[i])
-
-            if np.max(self.centroids - np.array(cluster_centers)) < 0.0001:
+    def predict(self, data_points, out=None):
+        """Label of the nearest fitted centroid for each point (e.g. a new placement), without refitting"""
+        return predict_labels(as_points(data_points, self.dtype), self.centroids, self.block_bytes, out, self.metric)
+
+    def transform(self, data_points, out=None):
+        """Distance from each point to every fitted centroid, in the model's metric"""
+        return centroid_distances(as_points(data_points, self.dtype), self.centroids, self.block_bytes, out,
+                                  self.metric)
+
+    def save(self, filename):
+        """Write the fitted centroids and settings to an .npz file"""
+        save_model(self, filename)
+
+    @classmethod
+    def load(cls, filename):
+        """A model saved with save, ready to predict"""
+        return load_model(cls, filename)
+
+
+def inertia(data_points, centroids, labels, weights=None, block_bytes=DEFAULT_BLOCK_BYTES, metric='sqeuclidean'):
+    """Sum of (weighted) squared distances (or distances in another metric) from each point to its centroid"""
+    centroids = np.asarray(centroids, dtype=np.float64)
+    rows = block_rows(1, data_points.shape[1], 8, block_bytes)
+    total = 0.0
+    for start in range(0, data_points.shape[0], rows):
+        diff = data_points[start:start + rows] - centroids[labels[start:start + rows]]
+        distances = _row_distances(diff, metric)
+        total += np.sum(distances if weights is None else distances * weights[start:start + rows])
+    return float(total)
+
+
+def _learning_rates(learning_rate, step, batch_weight_sums, seen_weight_sums):
+    """Per-centroid step size for one mini-batch update"""
+    if learning_rate == 'count':
+        # Each centroid becomes the running weighted mean of every point it has been given
+        rates = np.zeros_like(batch_weight_sums)
+        seen = seen_weight_sums > 0
+        rates[seen] = batch_weight_sums[seen] / seen_weight_sums[seen]
+        return rates
+    rate = learning_rate(step) if callable(learning_rate) else float(learning_rate)
+    return np.where(batch_weight_sums > 0, rate, 0.0)
+
+
+def minibatch_lloyd(data_points, weights, centroids, batch_size=1024, max_epochs=100, learning_rate='count',
+                    tol=1e-4, max_no_improvement=10, rng=np.random, block_bytes=DEFAULT_BLOCK_BYTES, out=None,
+                    callback=None):
+    """Mini-batch K-means shared by all three K-means classes
+
+    Each step assigns a random batch of points to the nearest centroid and moves every centroid
+    towards the weighted mean of its batch points by a per-centroid learning rate, so a point's
+    weight scales its pull on the centroid. learning_rate is 'count' (rate = batch weight /
+    total weight seen, the classic mini-batch schedule), a constant float, or a callable of the
+    step number. Stops after max_epochs passes worth of batches, when the largest centroid move
+    falls below tol times the data spread, or when the smoothed batch inertia has not improved
+    for max_no_improvement steps. Labels for all points are computed once at the end.
+    callback(step, shift, inertia) gets the largest centroid move and the smoothed batch inertia
+    per unit weight after every step, and may raise FitCancelled to stop the fit.
+    Returns (labels, centroids, n_steps).
+    """
+    centroids = np.array(centroids, dtype=np.float64)
+    n_points = data_points.shape[0]
+    k = centroids.shape[0]
+    batch_size = min(batch_size, n_points)
+    max_steps = max_epochs * -(-n_points // batch_size)
+    spread = np.max(np.amax(data_points, axis=0) - np.amin(data_points, axis=0))
+    tol_sq = (tol * spread) ** 2
+
+    seen_weight_sums = np.zeros(k)
+    smoothed_inertia = None
+    best_inertia = np.inf
+    no_improvement = 0
+    step = 0
+    while step < max_steps:
+        step += 1
+        indices = (rng.random(batch_size) * n_points).astype(np.intp)
+        batch = np.asarray(data_points[indices], dtype=np.float64)
+        batch_weights = np.ones(batch_size) if weights is None else weights[indices]
+
+        batch_labels = _nearest(batch, centroids)
+        batch_weight_sums = np.bincount(batch_labels, weights=batch_weights, minlength=k)
+        batch_means = centroids.copy()
+        filled = batch_weight_sums > 0
+        for j in range(centroids.shape[1]):
+            column_sums = np.bincount(batch_labels, weights=batch[:, j] * batch_weights, minlength=k)
+            batch_means[filled, j] = column_sums[filled] / batch_weight_sums[filled]
+
+        seen_weight_sums += batch_weight_sums
+        rates = _learning_rates(learning_rate, step, batch_weight_sums, seen_weight_sums)
+        new_centroids = centroids + rates[:, np.newaxis] * (batch_means - centroids)
+        shift_sq = np.max(np.sum((new_centroids - centroids) ** 2, axis=1))
+        centroids = new_centroids
+
+        # Smooth the batch inertia over roughly one pass worth of batches
+        batch_inertia = inertia(batch, centroids, batch_labels, batch_weights) / np.sum(batch_weights)
+        alpha = min(1.0, 2.0 * batch_size / (n_points + 1))
+        smoothed_inertia = batch_inertia if smoothed_inertia is None else (1 - alpha) * smoothed_inertia + alpha * batch_inertia
+        if callback is not None:
+            callback(step, float(np.sqrt(shift_sq)), float(smoothed_inertia))
+
+        if shift_sq <= tol_sq:
+            break
+        if smoothed_inertia < best_inertia:
+            best_inertia = smoothed_inertia
+            no_improvement = 0
+        else:
+            no_improvement += 1
+            if no_improvement >= max_no_improvement:
                 break
 
-            self.centroids = np.array(cluster_centers)
+    labels = assign_labels(data_points, centroids, block_bytes, out=label_buffer(n_points, out))
+    return labels, centroids, step
+
+
+# Names accepted by the clustering classes' init option
+SEEDING_METHODS = ('uniform', 'k-means++', 'k-means||')
+
+
+def _squared_distances(data_points, centroid, block_bytes=DEFAULT_BLOCK_BYTES):
+    """Squared distance from every point to one centroid, computed a block of points at a time"""
+    distances = np.empty(data_points.shape[0])
+    rows = block_rows(1, data_points.shape[1], 8, block_bytes)
+    for start in range(0, data_points.shape[0], rows):
+        diff = data_points[start:start + rows] - centroid
+        distances[start:start + rows] = np.einsum('ij,ij->i', diff, diff)
+    return distances
+
+
+def _closest_squared_distances(data_points, centroids, block_bytes=DEFAULT_BLOCK_BYTES):
+    """Squared distance from every point to the closest of several centroids"""
+    distances = np.empty(data_points.shape[0])
+    rows = block_rows(centroids.shape[0], data_points.shape[1], 8, block_bytes)
+    for start in range(0, data_points.shape[0], rows):
+        block = data_points[start:start + rows]
+        block_distances = (block[:, 0, np.newaxis] - centroids[np.newaxis, :, 0]) ** 2
+        for j in range(1, block.shape[1]):
+            block_distances += (block[:, j, np.newaxis] - centroids[np.newaxis, :, j]) ** 2
+        distances[start:start + rows] = np.min(block_distances, axis=1)
+    return distances
 
-        return y
 
+def _weighted_choice(probabilities, rng, size=1):
+    """Indices drawn with the given (unnormalized) probabilities, via one cumulative sum"""
+    cumulative = np.cumsum(probabilities)
+    draws = rng.random(size) * cumulative[-1]
+    return np.minimum(np.searchsorted(cumulative, draws, side='right'), len(cumulative) - 1)
 
 
+def uniform_init(data_points, k, rng=np.random):
+    """Centroids drawn uniformly inside the bounding box of the points (the original seeding)"""
+    return rng.uniform(np.amin(data_points, axis=0), np.amax(data_points, axis=0), size=(k, data_points.shape[1]))
+
+
+def kmeans_plus_plus(data_points, k, weights=None, rng=np.random, n_local_trials=None,
+                     block_bytes=DEFAULT_BLOCK_BYTES):
+    """Greedy k-means++ seeding; each point's weight multiplies its chance of becoming a centroid
+
+    The first centroid is drawn in proportion to the weights, every further one in proportion
+    to weight x squared distance to the closest centroid so far. Of n_local_trials candidates
+    per step (2 + log k by default) the one that lowers the weighted cost most is kept.
+    """
+    n_points = data_points.shape[0]
+    weights = np.ones(n_points) if weights is None else np.asarray(weights, dtype=np.float64)
+    if n_local_trials is None:
+        n_local_trials = 2 + int(np.log(k))
+
+    centroids = np.empty((k, data_points.shape[1]))
+    first = _weighted_choice(weights, rng)[0]
+    centroids[0] = data_points[first]
+    closest = _squared_distances(data_points, centroids[0], block_bytes)
+
+    for c in range(1, k):
+        potential = weights * closest
+        if potential.sum() <= 0:
+            # Fewer distinct points than centroids: any point will do
+            centroids[c] = data_points[_weighted_choice(weights, rng)[0]]
+            continue
+        candidates = _weighted_choice(potential, rng, n_local_trials)
+        best_cost, best_closest, best_candidate = np.inf, None, None
+        for candidate in candidates:
+            candidate_closest = np.minimum(closest, _squared_distances(data_points, data_points[candidate], block_bytes))
+            cost = np.dot(weights, candidate_closest)
+            if cost < best_cost:
+                best_cost, best_closest, best_candidate = cost, candidate_closest, candidate
+        centroids[c] = data_points[best_candidate]
+        closest = best_closest
+    return centroids
+
+
+def kmeans_parallel(data_points, k, weights=None, rng=np.random, oversampling=None, rounds=5,
+                    block_bytes=DEFAULT_BLOCK_BYTES):
+    """k-means|| seeding for large inputs, weighted like kmeans_plus_plus
+
+    Instead of k sequential passes, each of a few rounds samples every point independently with
+    probability oversampling x weight x squared distance / cost, so a handful of passes collect
+    O(oversampling x rounds) candidates. The candidates are weighted by the total point weight
+    closest to them and reduced to k centroids with weighted k-means++.
+    """
+    n_points = data_points.shape[0]
+    weights = np.ones(n_points) if weights is None else np.asarray(weights, dtype=np.float64)
+    if oversampling is None:
+        oversampling = 2 * k
+
+    candidates = [data_points[_weighted_choice(weights, rng)[0]]]
+    closest = _squared_distances(data_points, candidates[0], block_bytes)
+    for _ in range(rounds):
+        cost = np.dot(weights, closest)
+        if cost <= 0:
+            break
+        probabilities = np.minimum(1.0, oversampling * weights * closest / cost)
+        picked = np.flatnonzero(rng.random(n_points) < probabilities)
+        if picked.size:
+            new_candidates = np.asarray(data_points[picked], dtype=np.float64)
+            candidates.extend(new_candidates)
+            closest = np.minimum(closest, _closest_squared_distances(data_points, new_candidates, block_bytes))
+
+    candidates = np.array(candidates, dtype=np.float64)
+    if candidates.shape[0] <= k:
+        # Too few candidates (tiny or degenerate input); top up with k-means++ over all points
+        extra = kmeans_plus_plus(data_points, k - candidates.shape[0] + 1, weights, rng, block_bytes=block_bytes)
+        return np.vstack([candidates, extra[1:]])[:k]
+
+    owners = assign_labels(data_points, candidates, block_bytes)
+    candidate_weights = np.bincount(owners, weights=weights, minlength=candidates.shape[0])
+    return kmeans_plus_plus(candidates, k, candidate_weights, rng, block_bytes=block_bytes)
+
+
+def init_centroids(method, data_points, k, weights=None, rng=np.random, block_bytes=DEFAULT_BLOCK_BYTES):
+    """Initial centroids by name: 'uniform', 'k-means++' or 'k-means||'"""
+    if method == 'uniform':
+        return uniform_init(data_points, k, rng)
+    if method == 'k-means++':
+        return kmeans_plus_plus(data_points, k, weights, rng, block_bytes=block_bytes)
+    if method == 'k-means||':
+        return kmeans_parallel(data_points, k, weights, rng, block_bytes=block_bytes)
+    raise ValueError(f"Unknown init method {method!r}; expected one of {', '.join(SEEDING_METHODS)}")
+
+
+def restart_generators(random_state, n_init):
+    """One independent random generator per restart, all derived from a single base seed
+
+    Restart 0 draws from np.random.RandomState(random_state), the numbers the models drew when
+    they seeded the global np.random state, so a single restart keeps the labels it always had.
+    Restart i > 0 gets the i-th child of SeedSequence(random_state), so it draws the same numbers
+    whichever worker runs it, and n_init=1 is the first restart of any larger n_init.
+    """
+    children = np.random.SeedSequence(random_state).spawn(n_init)[1:]
+    return [np.random.RandomState(random_state)] + [np.random.default_rng(seed) for seed in children]
+
+
+def fit_restart(data_points, weights, k, init='uniform', algorithm='lloyd', max_iterations=100, batch_size=1024,
+                learning_rate='count', shift_tol=None, block_bytes=DEFAULT_BLOCK_BYTES, rng=np.random, out=None,
+                callback=None, metric='sqeuclidean', tol=1e-4, max_no_improvement=10):
+    """One complete fit (seeding, then Lloyd or mini-batch iterations) scored by its weighted inertia
+
+    callback receives the per-iteration progress of weighted_lloyd or minibatch_lloyd; tol and
+    max_no_improvement are minibatch_lloyd's stopping criteria. The inertia is measured in the
+    given metric; seeding is euclidean whatever the metric.
+    Returns (labels, centroids, n_iterations, inertia).
+    """
+    check_metric(metric, algorithm)
+    centroids = init_centroids(init, data_points, k, weights, rng, block_bytes)
+    if algorithm == 'minibatch':
+        labels, centroids, n_iterations = minibatch_lloyd(data_points, weights, centroids, batch_size, max_iterations,
+                                                          learning_rate, tol, max_no_improvement, rng, block_bytes, out,
+                                                          callback)
+    else:
+        labels, centroids, n_iterations = weighted_lloyd(data_points, weights, centroids, max_iterations, block_bytes,
+                                                         out, algorithm, shift_tol, callback, metric)
+    return labels, centroids, n_iterations, inertia(data_points, centroids, labels, weights, block_bytes, metric)
+
+
+def best_of_restarts(restart, n_init=1, random_state=42, n_jobs=1, executor='thread', out=None):
+    """Run n_init restarts and keep the one with the lowest objective
+
+    restart(rng, out) runs one fit and returns (labels, centroids, n_iterations, objective), like
+    fit_restart. With n_jobs > 1 the restarts run on a thread pool (NumPy releases the GIL in the
+    distance kernels) or, with executor='process', on a process pool, in which case restart must
+    be picklable and its arrays are copied to every worker. Ties go to the lowest restart index,
+    so the result does not depend on n_jobs. The winning labels are written into out when given.
+    A FitCancelled raised by any restart stops the others and propagates.
+    """
+    if n_init < 1:
+        raise ValueError(f"n_init must be at least 1, got {n_init}")
+    if executor not in ('thread', 'process'):
+        raise ValueError(f"Unknown executor {executor!r}; expected 'thread' or 'process'")
+    generators = restart_generators(random_state, n_init)
+    if n_init == 1:
+        # A single restart can write straight into the output buffer
+        return restart(generators[0], out)
+
+    if n_jobs == 1:
+        results = (restart(rng, None) for rng in generators)
+        best = min(results, key=lambda result: result[3])
+    else:
+        pool_class = ProcessPoolExecutor if executor == 'process' else ThreadPoolExecutor
+        with pool_class(max_workers=n_jobs) as pool:
+            # map yields in restart order, and min keeps the first of equal objectives
+            best = min(pool.map(restart, generators, [None] * n_init), key=lambda result: result[3])
+
+    labels, centroids, n_iterations, objective = best
+    if out is not None:
+        labels = label_buffer(labels.shape[0], out)
+        labels[:] = best[0]
+    return labels, centroids, n_iterations, objective
+
+
+class KMeansModel(CentroidModel):
+    """A CentroidModel fitted by n_init restarts of fit_restart, keeping the one with the lowest objective"""
+
+    def __init__(self, k, random_state, block_bytes, dtype, algorithm, batch_size, learning_rate, tol,
+                 max_no_improvement, init, n_init, n_jobs, executor, metric):
+        super().__init__(k, random_state, block_bytes, dtype, init, metric)
+        self.algorithm = algorithm  # 'lloyd', 'hamerly' (same result, faster for large K) or 'minibatch'
+        self.batch_size = batch_size  # Points per step in minibatch mode
+        self.learning_rate = learning_rate  # Minibatch step size: 'count', a constant or a callable of the step
+        self.tol = tol  # Minibatch: stop once no centroid moves more than this fraction of the data spread
+        self.max_no_improvement = max_no_improvement  # Minibatch: stop after this many steps without a better inertia
+        self.n_init = n_init  # Independent restarts; the one with the lowest (weighted) inertia is kept
+        self.n_jobs = n_jobs  # Workers running the restarts in parallel
+        self.executor = executor  # 'thread' or 'process' pool for the restarts
+
+    def _fit_restarts(self, data_points, weights, max_iterations, shift_tol, out=None, init=None, callback=None):
+        """Run the restarts on the given weights and keep the best one's centroids; returns its labels"""
+        restart = partial(fit_restart, data_points, weights, self.k, init or self.init, self.algorithm, max_iterations,
+                          self.batch_size, self.learning_rate, shift_tol, self.block_bytes, callback=callback,
+                          metric=self.metric, tol=self.tol, max_no_improvement=self.max_no_improvement)
+        labels, self.centroids, self.n_iterations, self.inertia = best_of_restarts(
+            restart, self.n_init, self.random_state, self.n_jobs, self.executor, out)
+        return labels
+
+
+class KMenasClustering(KMeansModel):
+    def __init__(self, k=3, max_iter=100, random_state=42, block_bytes=DEFAULT_BLOCK_BYTES, dtype=np.float64,
+                 algorithm='lloyd', batch_size=1024, learning_rate='count', tol=1e-4, max_no_improvement=10,
+                 init='uniform', n_init=1, n_jobs=1, executor='thread', metric='sqeuclidean'):
+        super().__init__(k, random_state, block_bytes, dtype, algorithm, batch_size, learning_rate, tol,
+                         max_no_improvement, init, n_init, n_jobs, executor, metric)
+        self.max_iter = max_iter
+
+    @staticmethod
+    def euclidean_distance(data_point,centroids): #Calculate the distance between a data point and all centroids and return an array of distances
+        return np.sqrt(np.sum((centroids - data_point)**2, axis=1))
+
+    def fit(self, date_points, out=None, init=None, callback=None):
+        # Use the input (array, memmap or SinkData table) as is when it already is a contiguous float array
+        date_points = as_points(date_points, self.dtype)
 
-    
-    
+        #Seed the centroids ('uniform' draws them within the min and max values of the data points), then assign
+        #each data point to the nearest centroid and move the centroids until they stop moving
+        return self._fit_restarts(date_points, None, self.max_iter, 0.0001, out, init, callback)
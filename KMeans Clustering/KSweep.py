@@ -0,0 +1,207 @@
+import argparse
+import csv
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+from DesignCache import load_design
+from KMeansClusteringHelper import KMenasClustering, inertia
+from WeightedKMeansClustering import WeightedKMeansClustering
+from EntropyKMeansClustering import EntropyKMeansClustering
+
+# Points sampled for the silhouette score, which is quadratic in the number of points
+DEFAULT_SILHOUETTE_SAMPLE = 2000
+
+# Arrays the parent shares with the workers, attached once per worker process
+_shared = {}
+
+
+def _share(arrays):
+    """Copy named arrays into one shared memory block; returns the block and a picklable layout"""
+    total = sum(array.nbytes for array in arrays.values())
+    block = shared_memory.SharedMemory(create=True, size=max(total, 1))
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        view = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf, offset=offset)
+        view[...] = array
+        layout[name] = (offset, array.shape, array.dtype.str)
+        offset += array.nbytes
+    return block, layout
+
+
+def _attach(block_name, layout):
+    """Worker initializer: map the shared arrays once instead of unpickling them for every task"""
+    block = shared_memory.SharedMemory(name=block_name)
+    _shared['block'] = block
+    for name, (offset, shape, dtype) in layout.items():
+        _shared[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf, offset=offset)
+
+
+def silhouette_score(data_points, labels, sample_size=DEFAULT_SILHOUETTE_SAMPLE, random_state=0):
+    """Mean silhouette over a random sample of the points (all of them when there are fewer)"""
+    n_points = data_points.shape[0]
+    if n_points > sample_size:
+        sample = np.random.default_rng(random_state).choice(n_points, sample_size, replace=False)
+        data_points, labels = data_points[sample], labels[sample]
+    clusters, labels = np.unique(labels, return_inverse=True)
+    if clusters.size < 2:
+        return float('nan')
+
+    diff = data_points[:, np.newaxis, :] - data_points[np.newaxis, :, :]
+    distances = np.sqrt(np.einsum('ijk,ijk->ij', diff, diff))
+    membership = np.zeros((labels.size, clusters.size))
+    membership[np.arange(labels.size), labels] = 1.0
+    counts = membership.sum(axis=0)
+    cluster_sums = distances @ membership
+
+    rows = np.arange(labels.size)
+    own_counts = counts[labels] - 1
+    a = np.divide(cluster_sums[rows, labels], own_counts, out=np.zeros(labels.size), where=own_counts > 0)
+    mean_to_cluster = cluster_sums / counts
+    mean_to_cluster[rows, labels] = np.inf
+    b = np.min(mean_to_cluster, axis=1)
+    scores = np.where(own_counts > 0, (b - a) / np.maximum(np.maximum(a, b), 1e-300), 0.0)
+    return float(np.mean(scores))
+
+
+def _make_model(mode, k, seed, algorithm, init):
+    if mode == 'regular':
+        return KMenasClustering(k=k, random_state=seed, algorithm=algorithm, init=init)
+    if mode == 'weighted':
+        return WeightedKMeansClustering(k=k, random_state=seed, algorithm=algorithm, init=init)
+    return EntropyKMeansClustering(k=k, random_state=seed, algorithm=algorithm, init=init)
+
+
+def _fit_one(mode, k, seed, algorithm, init, neighborhood_size, silhouette_sample):
+    """Worker task: fit one (K, seed) pair on the shared arrays and score it"""
+    data_points = _shared['points']
+    weights = _shared.get('weights')
+    model = _make_model(mode, k, seed, algorithm, init)
+
+    start_time = time.perf_counter()
+    if mode == 'regular':
+        labels = model.fit(data_points)
+    else:
+        model.set_weights(weights)
+        if mode == 'weighted':
+            labels = model.fit(data_points)
+        else:
+            labels = model.fit(data_points, neighborhood_size=neighborhood_size)
+    elapsed = time.perf_counter() - start_time
+
+    return {
+        "k": k,
+        "seed": seed,
+        "inertia": inertia(data_points, model.centroids, labels),
+        "weighted_inertia": None if weights is None else inertia(data_points, model.centroids, labels, weights),
+        "silhouette": silhouette_score(data_points, labels, silhouette_sample, seed),
+        "iterations": model.n_iterations,
+        "seconds": elapsed,
+    }
+
+
+def sweep(data_points, weights=None, k_max=10, k_min=2, seeds=(42,), mode='regular', algorithm='hamerly',
+          init='k-means++', workers=None, neighborhood_size=5, silhouette_sample=DEFAULT_SILHOUETTE_SAMPLE):
+    """Fit every K in [k_min, k_max] for every seed across a process pool and score each fit
+
+    The points (and weights) are placed in shared memory once; workers map them instead of
+    receiving a pickled copy per task. weights are required for the weighted and entropy modes
+    and are normalized to sum to 1 for the weighted inertia. Returns one row per (K, seed)
+    with inertia, weighted inertia, silhouette (on a sample), iterations and fit time.
+    """
+    data_points = np.ascontiguousarray(getattr(data_points, 'points', data_points), dtype=np.float64)
+    arrays = {"points": data_points}
+    if weights is not None:
+        weights = np.asarray(getattr(weights, 'capacitances', weights), dtype=np.float64)
+        arrays["weights"] = weights / np.sum(weights)
+    elif mode != 'regular':
+        raise ValueError(f"The {mode} mode needs weights (e.g. capacitances)")
+
+    block, layout = _share(arrays)
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_attach, initargs=(block.name, layout)) as pool:
+            futures = [
+                pool.submit(_fit_one, mode, k, seed, algorithm, init, neighborhood_size, silhouette_sample)
+                for k in range(k_min, k_max + 1) for seed in seeds
+            ]
+            rows = [future.result() for future in futures]
+    finally:
+        block.close()
+        block.unlink()
+    return rows
+
+
+def summarize(rows):
+    """Best (lowest inertia) seed per K, plus the suggested K by silhouette and by the elbow rule"""
+    best = {}
+    for row in rows:
+        if row["k"] not in best or row["inertia"] < best[row["k"]]["inertia"]:
+            best[row["k"]] = row
+    per_k = [best[k] for k in sorted(best)]
+
+    silhouettes = np.array([row["silhouette"] for row in per_k])
+    by_silhouette = per_k[int(np.nanargmax(silhouettes))]["k"] if np.any(np.isfinite(silhouettes)) else None
+
+    # Elbow: the K whose (normalized) inertia lies furthest below the line joining the ends
+    elbow = None
+    if len(per_k) >= 3:
+        ks = np.array([row["k"] for row in per_k], dtype=np.float64)
+        values = np.array([row["inertia"] for row in per_k])
+        x = (ks - ks[0]) / (ks[-1] - ks[0])
+        y = (values - values[-1]) / max(values[0] - values[-1], 1e-300)
+        elbow = int(ks[np.argmax((1 - x) - y)])
+    return per_k, by_silhouette, elbow
+
+
+def print_report(rows):
+    per_k, by_silhouette, elbow = summarize(rows)
+    print(f"{'K':>4} {'seed':>6} {'inertia':>14} {'weighted inertia':>17} {'silhouette':>11} {'iter':>5} {'time (s)':>9}")
+    for row in per_k:
+        weighted = "-" if row["weighted_inertia"] is None else f"{row['weighted_inertia']:.6g}"
+        print(f"{row['k']:>4} {row['seed']:>6} {row['inertia']:>14.6g} {weighted:>17} "
+              f"{row['silhouette']:>11.4f} {row['iterations']:>5} {row['seconds']:>9.3f}")
+    print(f"Suggested K: {by_silhouette} (best silhouette), {elbow} (elbow of inertia)")
+
+
+def write_csv(rows, path):
+    with open(path, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep K in parallel and report inertia and silhouette per K")
+    parser.add_argument("--mode", choices=["regular", "weighted", "entropy"], default="regular")
+    parser.add_argument("--k-min", type=int, default=2)
+    parser.add_argument("--k-max", type=int, default=20)
+    parser.add_argument("--seeds", type=int, nargs="+", default=[42], help="Seeds to fit for every K")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--algorithm", choices=["lloyd", "hamerly", "minibatch"], default="hamerly")
+    parser.add_argument("--init", choices=["uniform", "k-means++", "k-means||"], default="k-means++")
+    parser.add_argument("--neighborhood-size", type=int, default=5, help="Entropy mode neighborhood size")
+    parser.add_argument("--silhouette-sample", type=int, default=DEFAULT_SILHOUETTE_SAMPLE)
+    parser.add_argument("--coord", default=os.path.join("input", "data.txt"), help="Coordinate file")
+    parser.add_argument("--cap", default=os.path.join("input", "capacitenceData.txt"), help="Capacitance (SPEF) file")
+    parser.add_argument("--csv", help="Also write every (K, seed) row to this CSV file")
+    args = parser.parse_args()
+
+    sinks = load_design(args.coord, args.cap)
+    weights = sinks.capacitances if np.any(sinks.capacitances > 0) else None
+    if weights is None and args.mode != "regular":
+        parser.error(f"the {args.mode} mode needs capacitances, but none were found in {args.cap}")
+
+    start_time = time.perf_counter()
+    rows = sweep(sinks.points, weights, args.k_max, args.k_min, args.seeds, args.mode, args.algorithm,
+                 args.init, args.workers, args.neighborhood_size, args.silhouette_sample)
+    print(f"Fitted {len(rows)} models on {len(sinks)} sinks in {time.perf_counter() - start_time:.2f} s")
+    print_report(rows)
+    if args.csv:
+        write_csv(rows, args.csv)
+        print(f"Wrote {args.csv}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,7 @@ from tkinter import ttk
 from RegularKMeansUI import RegularKMeansUI
 from WeightedKMeansUI import WeightedKMeansUI
 from EntropyKMeansUI import EntropyKMeansUI
+from ResultCache import DEFAULT_RESULT_DIR, ResultCache
 import sys
 
 class MainUI:
@@ -20,6 +21,9 @@ class MainUI:
         # Store current UI
         self.current_ui = None
         
+        # Fit results shared by every window opened from here, persisted so a new session reuses them
+        self.result_cache = ResultCache(cache_dir=DEFAULT_RESULT_DIR)
+        
         # Set up window close handler
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
 
@@ -58,11 +62,11 @@ class MainUI:
         new_window.protocol("WM_DELETE_WINDOW", lambda: self.close_child_window(new_window))
         
         if ui_type == "regular":
-            self.current_ui = RegularKMeansUI(new_window)
+            self.current_ui = RegularKMeansUI(new_window, self.result_cache)
         elif ui_type == "weighted":
-            self.current_ui = WeightedKMeansUI(new_window)
+            self.current_ui = WeightedKMeansUI(new_window, self.result_cache)
         else:  # entropy
-            self.current_ui = EntropyKMeansUI(new_window)
+            self.current_ui = EntropyKMeansUI(new_window, self.result_cache)
 
     def close_child_window(self, window):
         """Handle closing of child windows"""
@@ -0,0 +1,52 @@
+import os
+import numpy as np
+from DesignCache import DEFAULT_CACHE_DIR, load_design
+
+# Rows copied per step when writing a store, so writing never holds a second full copy
+_COPY_ROWS = 1 << 20
+
+
+class PointStore:
+    """Sink coordinates in an .npy file, memory-mapped instead of loaded into memory
+
+    The clustering classes read `points` in blocks without copying it, and write labels into
+    an output array preallocated with `allocate_labels`, so only the pages being worked on
+    need to be resident.
+    """
+
+    def __init__(self, path, mode='r'):
+        self.path = path
+        self.points = np.load(path, mmap_mode=mode)
+
+    def __len__(self):
+        return self.points.shape[0]
+
+    @classmethod
+    def create(cls, path, n_points, n_features=2, dtype=np.float64):
+        """Create an empty store of the given shape, opened for writing"""
+        np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(n_points, n_features)).flush()
+        return cls(path, mode='r+')
+
+    @classmethod
+    def from_array(cls, path, points, dtype=np.float64):
+        """Write an existing array (or memmap) to a new store, a chunk of rows at a time"""
+        store = cls.create(path, points.shape[0], points.shape[1], dtype)
+        for start in range(0, points.shape[0], _COPY_ROWS):
+            store.points[start:start + _COPY_ROWS] = points[start:start + _COPY_ROWS]
+        store.points.flush()
+        return cls(path)
+
+    @classmethod
+    def from_design(cls, coord_file, cap_file, cache_dir=DEFAULT_CACHE_DIR):
+        """Store over the cached points of a parsed design, parsing and caching it first if needed"""
+        sinks = load_design(coord_file, cap_file, cache_dir, mmap_mode='r')
+        store = cls.__new__(cls)
+        store.path = sinks.points.filename
+        store.points = sinks.points
+        return store
+
+    def allocate_labels(self, path=None):
+        """Preallocated int32 label output, memory-mapped next to the store unless a path is given"""
+        if path is None:
+            path = os.path.splitext(self.path)[0] + "_labels.npy"
+        return np.lib.format.open_memmap(path, mode='w+', dtype=np.int32, shape=(len(self),))
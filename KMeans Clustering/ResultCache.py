@@ -0,0 +1,131 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# Default memory cap for the cached labels and centroids
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+# Where MainUI persists fit results. Kept outside the parsed-design cache, whose prune and clear
+# commands remove everything in their directory
+DEFAULT_RESULT_DIR = ".result_cache"
+
+
+class ResultCache:
+    """LRU cache of fit results (labels and centroids) with a memory cap
+
+    Keys are tuples such as (dataset, mode, algorithm, K, neighborhood_size, seed); see `key`.
+    When the cached arrays exceed max_bytes the least recently used results are dropped. With a
+    cache_dir every result is also written there as an .npz file, so a result evicted from memory,
+    or computed in an earlier session, is read back instead of refitted. Safe to share between
+    windows and to fill from fit worker threads.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, cache_dir=None):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.entries = OrderedDict()
+        self.size = 0  # Bytes held in memory
+        self.lock = threading.Lock()
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(dataset, mode, algorithm, k, neighborhood_size=None, seed=42):
+        return (dataset, mode, algorithm, int(k), None if neighborhood_size is None else int(neighborhood_size), seed)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _path(self, key):
+        name = hashlib.blake2b(repr(key).encode(), digest_size=16).hexdigest()
+        return os.path.join(self.cache_dir, f"{name}.npz")
+
+    def _keep(self, key, labels, centroids):
+        # Called with the lock held
+        nbytes = labels.nbytes + centroids.nbytes
+        if key in self.entries:
+            self.size -= self.entries.pop(key)[2]
+        if nbytes > self.max_bytes:
+            return
+        self.entries[key] = (labels, centroids, nbytes)
+        self.size += nbytes
+        while self.size > self.max_bytes:
+            _, (_, _, evicted) = self.entries.popitem(last=False)
+            self.size -= evicted
+
+    def get(self, key):
+        """Cached (labels, centroids) for key, or None"""
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                labels, centroids, _ = self.entries[key]
+                return labels, centroids
+        if self.cache_dir is None:
+            return None
+
+        try:
+            with np.load(self._path(key)) as stored:
+                labels, centroids = stored["labels"], stored["centroids"]
+        except (FileNotFoundError, OSError, KeyError, ValueError):
+            return None
+        with self.lock:
+            self._keep(key, labels, centroids)
+        return labels, centroids
+
+    def put(self, key, labels, centroids, inputs=None):
+        """Cache a result; the arrays are kept as they are, so they must not be modified afterwards
+
+        inputs names the files the dataset was read from (any strings), so evict_stale can later
+        tell this result apart from the results of other designs.
+        """
+        labels, centroids = np.asarray(labels), np.asarray(centroids)
+        with self.lock:
+            self._keep(key, labels, centroids)
+        if self.cache_dir is not None:
+            # Write to a temporary file and rename it so a reader never sees a partial result
+            path = self._path(key)
+            tmp_path = f"{path[:-4]}.tmp{os.getpid()}_{threading.get_ident()}.npz"
+            # The dataset and its input files are stored too, so evict_stale can find the results of outdated inputs
+            np.savez(tmp_path, labels=labels, centroids=centroids, dataset=np.array(str(key[0])),
+                     inputs=np.array([str(name) for name in inputs or ()], dtype=str))
+            os.replace(tmp_path, path)
+
+    def clear(self, disk=False):
+        """Drop the results held in memory, and the persisted ones too with disk=True"""
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+        if disk and self.cache_dir is not None:
+            for name in os.listdir(self.cache_dir):
+                if name.endswith(".npz"):
+                    os.remove(os.path.join(self.cache_dir, name))
+
+    def evict_stale(self, dataset, inputs):
+        """Delete the persisted results of these input files computed from other contents; returns the number deleted
+
+        dataset identifies the current contents of the inputs (see DesignCache.design_key). Results
+        stored for other input files are kept, as are the ones stored without their inputs.
+        """
+        removed = 0
+        if self.cache_dir is None:
+            return removed
+        inputs = [str(name) for name in inputs]
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".npz"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                with np.load(path) as stored:
+                    stale = ("inputs" in stored.files and stored["inputs"].tolist() == inputs
+                             and str(stored["dataset"]) != str(dataset))
+            except (OSError, ValueError, KeyError):
+                stale = True
+            if stale:
+                try:
+                    os.remove(path)
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
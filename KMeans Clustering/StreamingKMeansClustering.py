@@ -0,0 +1,167 @@
+import numpy as np
+from FileReader import XYCoordinateExtractor
+from KMeansClusteringHelper import (DEFAULT_BLOCK_BYTES, CentroidModel, as_points, assign_and_reduce, assign_labels,
+                                    centroids_from_sums, init_centroids, label_buffer, restart_generators,
+                                    uniform_init)
+
+# Sinks per chunk when the source is an XYCoordinateExtractor or an array
+DEFAULT_CHUNK_SIZE = 1 << 20
+
+# Points kept in the random sample that seeds k-means++ and k-means||
+DEFAULT_SEED_SAMPLE = 100000
+
+
+class StreamingKMeansClustering(CentroidModel):
+    """Weighted K-means for sink sets that do not fit in memory, read in chunks on every pass
+
+    Same interface as WeightedKMeansClustering, but fit takes a chunk source instead of an array:
+    an XYCoordinateExtractor (streamed with iter_chunks), a callable returning a fresh iterator of
+    (points, capacitances) chunks, or an array/memmap/SinkData that is sliced into chunks. Each
+    Lloyd pass only accumulates per-cluster weighted sums, so memory is O(chunk + K) apart from
+    the labels, which can be a memory-mapped output. The streamed capacitances are the weights unless set_weights is
+    given per-sink weights; either way they are normalized like WeightedKMeansClustering's.
+    """
+
+    def __init__(self, k=3, max_iterations=100, random_state=42, block_bytes=DEFAULT_BLOCK_BYTES, dtype=np.float64,
+                 init='uniform', chunk_size=DEFAULT_CHUNK_SIZE, seed_sample=DEFAULT_SEED_SAMPLE, tol=0.0):
+        super().__init__(k, random_state, block_bytes, dtype, init)
+        self.max_iterations = max_iterations
+        self.n_points = None  # Sinks seen in the first pass of the last fit
+        self.weights = None  # Per-sink weights overriding the streamed capacitances
+        self.weight_floor = None  # Weight given to non-positive weights, set by the first pass
+        self.weight_total = None  # Sum of the weights after that replacement, for normalizing
+        self.chunk_size = chunk_size  # Sinks per chunk for sources that are chunked here
+        self.seed_sample = seed_sample  # Sample size for the k-means++ variants
+        self.tol = tol  # Also stop once no centroid moves more than this
+
+    def set_weights(self, weights):
+        """Use these weights (an array or memmap with one weight per sink, or a SinkData) instead of the
+        streamed capacitances; they are read a chunk at a time and normalized during the fit"""
+        self.weights = getattr(weights, 'capacitances', weights)
+
+    def _chunks(self, source):
+        """(offset, points, raw weights) for every chunk of one pass over the source"""
+        if isinstance(source, XYCoordinateExtractor):
+            chunks = source.iter_chunks(self.chunk_size)
+        elif callable(source):
+            chunks = source()
+        else:
+            all_points = getattr(source, 'points', source)
+            all_capacitances = getattr(source, 'capacitances', None)
+            chunks = ((all_points[start:start + self.chunk_size],
+                       None if all_capacitances is None else all_capacitances[start:start + self.chunk_size])
+                      for start in range(0, all_points.shape[0], self.chunk_size))
+
+        offset = 0
+        for points, capacitances in chunks:
+            points = as_points(points, self.dtype)
+            n_points = points.shape[0]
+            weights = capacitances if self.weights is None else self.weights[offset:offset + n_points]
+            weights = np.ones(n_points) if weights is None else np.asarray(weights, dtype=np.float64)
+            yield offset, points, weights
+            offset += n_points
+
+    def _normalize(self, weights):
+        # Same treatment as set_weights of the in-memory class, with the totals from the first pass
+        weights = np.where(weights > 0, weights, self.weight_floor)
+        return weights / self.weight_total
+
+    def _scan(self, source, sample_rng):
+        """First pass: point count, bounds, weight totals and (for k-means++ seeding) a uniform sample"""
+        n_points, lower, upper = 0, None, None
+        positive_sum, positive_min, n_non_positive = 0.0, np.inf, 0
+        sample = sample_keys = sample_weights = None
+        for _, points, weights in self._chunks(source):
+            if points.shape[0] == 0:
+                continue
+            n_points += points.shape[0]
+            lower = np.amin(points, axis=0) if lower is None else np.minimum(lower, np.amin(points, axis=0))
+            upper = np.amax(points, axis=0) if upper is None else np.maximum(upper, np.amax(points, axis=0))
+            positive = weights > 0
+            positive_sum += float(np.sum(weights[positive]))
+            if np.any(positive):
+                positive_min = min(positive_min, float(np.min(weights[positive])))
+            n_non_positive += int(np.count_nonzero(~positive))
+
+            if sample_rng is not None:
+                # Reservoir sample: keep the points with the smallest random keys seen so far
+                keys = sample_rng.random(points.shape[0])
+                if sample is not None:
+                    points = np.vstack([sample, points])
+                    keys = np.concatenate([sample_keys, keys])
+                    weights = np.concatenate([sample_weights, weights])
+                if keys.size > self.seed_sample:
+                    keep = np.argpartition(keys, self.seed_sample)[:self.seed_sample]
+                    points, keys, weights = points[keep], keys[keep], weights[keep]
+                sample, sample_keys, sample_weights = np.array(points), keys, weights
+
+        if n_points == 0:
+            raise ValueError("The source has no sinks to cluster")
+        if positive_sum <= 0:
+            print("Warning: Found no positive weights. Clustering with equal weights.")
+            self.weight_floor, self.weight_total = 1.0, float(n_points)
+        else:
+            if n_non_positive:
+                print("Warning: Found zero or negative weights. Converting to small positive values.")
+            self.weight_floor = positive_min * 0.1
+            self.weight_total = positive_sum + n_non_positive * self.weight_floor
+        self.n_points = n_points
+        return np.vstack([lower, upper]), sample, sample_weights
+
+    def fit(self, source, out=None, init=None, callback=None):
+        """Fit the model to a chunk source; returns the labels, like WeightedKMeansClustering.fit
+
+        The labels of the last pass are written into out when it is given (e.g. a memory-mapped
+        int32 array from PointStore.allocate_labels, for sources larger than memory), and into a
+        new array otherwise. The fit stops once no label changes or no centroid moves more than
+        tol. Use iter_labels for the labels chunk by chunk. callback(iteration, shift, inertia)
+        is called after every pass.
+        """
+        init = init or self.init
+        init_rng, sample_rng = restart_generators(self.random_state, 2)
+        bounds, sample, sample_weights = self._scan(source, None if init == 'uniform' else sample_rng)
+
+        if init == 'uniform':
+            # The same draw as the in-memory class: uniform within the bounding box of all points
+            centroids = uniform_init(bounds, self.k, init_rng)
+        else:
+            centroids = init_centroids(init, sample, self.k, self._normalize(sample_weights), init_rng,
+                                       self.block_bytes)
+        centroids = np.array(centroids, dtype=np.float64)
+        out = label_buffer(self.n_points, out)
+
+        self.n_iterations = 0
+        for self.n_iterations in range(1, self.max_iterations + 1):
+            sums = np.zeros_like(centroids)
+            weight_sums = np.zeros(self.k)
+            square_norm = 0.0
+            n_changed = 0
+            for offset, points, weights in self._chunks(source):
+                weights = self._normalize(weights)
+                labels = out[offset:offset + points.shape[0]]
+                chunk_changed, chunk_sums, chunk_weight_sums = assign_and_reduce(points, centroids, labels, weights,
+                                                                                 self.block_bytes)
+                n_changed += chunk_changed
+                sums += chunk_sums
+                weight_sums += chunk_weight_sums
+                square_norm += float(np.dot(np.einsum('ij,ij->i', points, points), weights))
+
+            new_centroids = centroids_from_sums(sums, weight_sums, centroids)
+            shift = float(np.sqrt(np.max(np.sum((new_centroids - centroids) ** 2, axis=1))))
+            non_empty = weight_sums > 0
+            self.inertia = max(square_norm - float(np.sum(np.sum(sums[non_empty] ** 2, axis=1) / weight_sums[non_empty])), 0.0)
+            centroids = new_centroids
+            if callback is not None:
+                callback(self.n_iterations, shift, self.inertia)
+
+            # Check for convergence
+            if n_changed == 0 or shift <= self.tol:
+                break
+
+        self.centroids = centroids
+        return out
+
+    def iter_labels(self, source):
+        """Yield the nearest-centroid labels of each chunk of the source, in order"""
+        for _, points, _ in self._chunks(source):
+            yield assign_labels(points, self.centroids, self.block_bytes)
@@ -1,67 +1,70 @@
 import numpy as np
+from IncrementalKMeans import update_clusters
+from KMeansClusteringHelper import DEFAULT_BLOCK_BYTES, KMeansModel, as_points
 
-class WeightedKMeansClustering:
-    def __init__(self, k=3, max_iterations=100, random_state=42):
-        self.k = k
+def normalize_weights(weights):
+    """Weights (e.g., capacitance values or a SinkData table) as float64 summing to 1, and the sum they were divided by
+
+    Zero or negative weights are replaced with a tenth of the smallest positive weight first.
+    """
+    weights = getattr(weights, 'capacitances', weights)
+    # Convert to numpy array with higher precision
+    weights = np.array(weights, dtype=np.float64)
+
+    # Check for zero or negative weights
+    if np.any(weights <= 0):
+        print("Warning: Found zero or negative weights. Converting to small positive values.")
+        # Replace zero or negative values with a small positive value
+        weights[weights <= 0] = np.min(weights[weights > 0]) * 0.1
+
+    # Normalize weights to sum to 1 with higher precision
+    weight_sum = np.sum(weights)
+    return weights / weight_sum, weight_sum
+
+
+class WeightedKMeansClustering(KMeansModel):
+    def __init__(self, k=3, max_iterations=100, random_state=42, block_bytes=DEFAULT_BLOCK_BYTES, dtype=np.float64,
+                 algorithm='lloyd', batch_size=1024, learning_rate='count', tol=1e-4, max_no_improvement=10,
+                 init='uniform', n_init=1, n_jobs=1, executor='thread', metric='sqeuclidean'):
+        super().__init__(k, random_state, block_bytes, dtype, algorithm, batch_size, learning_rate, tol,
+                         max_no_improvement, init, n_init, n_jobs, executor, metric)
         self.max_iterations = max_iterations
-        self.centroids = None
         self.weights = None
-        self.random_state = random_state
-        # Set random seed for reproducibility
-        np.random.seed(random_state)
+        self.weight_scale = None  # Sum the weights were divided by, to put new capacitances on the same scale
 
     def set_weights(self, weights):
-        """Set the weights to use for clustering (e.g., capacitance values)"""
-        # Convert to numpy array with higher precision
-        self.weights = np.array(weights, dtype=np.float64)
-        
-        # Check for zero or negative weights
-        if np.any(self.weights <= 0):
-            print("Warning: Found zero or negative weights. Converting to small positive values.")
-            # Replace zero or negative values with a small positive value
-            self.weights[self.weights <= 0] = np.min(self.weights[self.weights > 0]) * 0.1
-        
-        # Normalize weights to sum to 1 with higher precision
-        weight_sum = np.sum(self.weights)
+        """Set the weights to use for clustering (e.g., capacitance values or a SinkData table)"""
+        self.weights, self.weight_scale = normalize_weights(weights)
 
-        self.weights = self.weights / weight_sum
-
-    def fit(self, data_points):
-        n_points = data_points.shape[0]
-        n_features = data_points.shape[1]
+    def fit(self, data_points, out=None, init=None, callback=None):
+        data_points = as_points(data_points, self.dtype)
         
         # Ensure weights are set
         if self.weights is None:
             raise ValueError("Weights must be set before fitting. Use set_weights() method.")
         
-        # Initialize centroids randomly within the data bounds
-        min_vals = np.amin(data_points, axis=0)
-        max_vals = np.amax(data_points, axis=0)
-        self.centroids = np.random.uniform(min_vals, max_vals, size=(self.k, n_features))
-        
-        # Initialize labels
-        labels = np.zeros(n_points, dtype=int)
-        
-        for _ in range(self.max_iterations):
-            old_labels = labels.copy()
-            
-            # Assign points to clusters
-            for i in range(n_points):
-                distances = np.linalg.norm(data_points[i] - self.centroids, axis=1)
-                weighted_distances = distances * self.weights[i]
-                labels[i] = np.argmin(weighted_distances)
-            
-            # Update centroids
-            for j in range(self.k):
-                if np.sum(labels == j) > 0:
-                    cluster_points = data_points[labels == j]
-                    cluster_weights = self.weights[labels == j]
-                    weighted_sum = np.sum(cluster_points * cluster_weights[:, np.newaxis], axis=0)
-                    weight_sum = np.sum(cluster_weights)
-                    self.centroids[j] = weighted_sum / weight_sum
-            
-            # Check for convergence
-            if np.array_equal(old_labels, labels):
-                break
-        
-        return labels 
\ No newline at end of file
+        # Each restart seeds the centroids ('uniform' draws them randomly within the data bounds; the
+        # k-means++ variants favour heavier points) and runs the shared weighted Lloyd or mini-batch
+        # kernel; labels go into out when a preallocated, e.g. memory-mapped, array is given, and
+        # callback(iteration, shift, inertia) follows the progress of every iteration
+        labels = self._fit_restarts(data_points, self.weights, self.max_iterations, None, out, init, callback)
+
+        return labels
+
+    def update(self, data_points, labels, delta, max_iterations=None):
+        """Re-cluster after an ECO from the fitted centroids instead of refitting from scratch
+
+        delta is a SinkDelta of added, removed and moved sinks (capacitances in the units given
+        to set_weights); labels are the labels of the last fit or update. The iterations restart
+        from the current centroids, so the partition stays close to the previous one and needs
+        far fewer distance computations. Updates the weights and centroids and returns
+        (points, labels, changed): the sinks after the change (remaining ones in order, then the
+        added ones), their labels and the new indices of the remaining sinks that changed cluster.
+        """
+        if self.centroids is None or self.weights is None:
+            raise ValueError("The model must be fitted before it can be updated.")
+        points, capacitances, labels, self.centroids, changed, _ = update_clusters(
+            as_points(data_points, self.dtype), self.weights * self.weight_scale, self.centroids, labels, delta,
+            max_iterations or self.max_iterations, self.block_bytes)
+        self.set_weights(capacitances)
+        return points, labels, changed
@@ -0,0 +1,168 @@
+import argparse
+import os
+import time
+import numpy as np
+from FileReader import XYCoordinateExtractor
+from KMeansClusteringHelper import METRICS, SEEDING_METHODS, KMenasClustering, distance_matrix, inertia
+from WeightedKMeansClustering import WeightedKMeansClustering
+from EntropyKMeansClustering import EntropyKMeansClustering
+
+
+def load_sinks(repeat=1, jitter=0.5):
+    """Load points and capacitances from input/, optionally tiled with jitter to emulate a larger design
+
+    When no capacitance file is available the capacitances are drawn uniformly so the weighted
+    algorithms still have positive weights to work with.
+    """
+    extractor = XYCoordinateExtractor(
+        os.path.join("input", "data.txt"),
+        os.path.join("input", "capacitenceData.txt")
+    )
+    sinks = extractor.extract_columns()
+    points, capacitances = sinks.points, sinks.capacitances
+    rng = np.random.default_rng(0)
+    if not np.any(capacitances > 0):
+        capacitances = rng.uniform(1e-5, 5e-5, points.shape[0])
+    if repeat > 1:
+        points = np.tile(points, (repeat, 1)) + rng.normal(0, jitter, (points.shape[0] * repeat, 2))
+        capacitances = np.tile(capacitances, repeat)
+    return points, capacitances
+
+
+def load_points(repeat=1, jitter=0.5):
+    """Load input/data.txt, optionally tiled with jitter to emulate a larger design"""
+    return load_sinks(repeat, jitter)[0]
+
+
+def loop_kmeans(date_points, k=3, max_iter=100, random_state=42):
+    """The original per-point K-means loop, kept here as the reference for the benchmarks"""
+    date_points = np.array(date_points)
+    np.random.seed(random_state)
+    centroids = np.random.uniform(np.amin(date_points, axis=0), np.amax(date_points, axis=0), size=(k, date_points.shape[1]))
+
+    for _ in range(max_iter):
+        y = []
+        for data_point in date_points:
+            distances = KMenasClustering.euclidean_distance(data_point, centroids)
+            y.append(np.argmin(distances))
+        y = np.array(y)
+
+        cluster_centers = []
+        for i in range(k):
+            indices = np.argwhere(y == i)
+            if len(indices) > 0:
+                cluster_centers.append(np.mean(date_points[indices], axis=0)[0])
+            else:
+                cluster_centers.append(centroids[i])
+
+        if np.max(centroids - np.array(cluster_centers)) < 0.0001:
+            break
+        centroids = np.array(cluster_centers)
+
+    return y, centroids
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def benchmark_assignment(points, k_values):
+    """Compare the vectorized KMenasClustering.fit against the original per-point loop"""
+    print(f"{'K':>4} {'loop (s)':>10} {'vectorized (s)':>15} {'speedup':>8} {'same labels':>12}")
+    for k in k_values:
+        (loop_labels, _), loop_time = timed(loop_kmeans, points, k=k)
+        fast_labels, fast_time = timed(KMenasClustering(k=k).fit, points)
+        same = np.array_equal(loop_labels, fast_labels)
+        print(f"{k:>4} {loop_time:>10.3f} {fast_time:>15.4f} {loop_time / fast_time:>7.1f}x {str(same):>12}")
+
+
+def _model_weights(model):
+    # The entropy class folds its entropies into the weights inside fit; score it by capacitance
+    return getattr(model, 'weights', None)
+
+
+def benchmark_minibatch(points, capacitances, k_values, batch_size=1024):
+    """Compare mini-batch against full-batch fits of all three algorithms: wall time and inertia gap"""
+    print(f"{'algorithm':>10} {'K':>4} {'full (s)':>9} {'minibatch (s)':>14} {'speedup':>8} {'inertia gap':>12}")
+    for name, cls in (("regular", KMenasClustering), ("weighted", WeightedKMeansClustering),
+                      ("entropy", EntropyKMeansClustering)):
+        for k in k_values:
+            results = {}
+            for algorithm in ("lloyd", "minibatch"):
+                model = cls(k=k, algorithm=algorithm, batch_size=batch_size)
+                if cls is not KMenasClustering:
+                    model.set_weights(capacitances)
+                labels, elapsed = timed(model.fit, points)
+                results[algorithm] = (elapsed, inertia(points, model.centroids, labels, _model_weights(model)))
+            (full_time, full_inertia), (fast_time, fast_inertia) = results["lloyd"], results["minibatch"]
+            gap = (fast_inertia - full_inertia) / full_inertia
+            print(f"{name:>10} {k:>4} {full_time:>9.3f} {fast_time:>14.3f} {full_time / fast_time:>7.1f}x {gap:>11.2%}")
+
+
+def benchmark_seeding(points, capacitances, k_values):
+    """Iterations to converge, wall time and inertia for each seeding method on all three algorithms"""
+    print(f"{'algorithm':>10} {'K':>4} {'init':>10} {'iterations':>11} {'time (s)':>9} {'inertia':>14}")
+    for name, cls in (("regular", KMenasClustering), ("weighted", WeightedKMeansClustering),
+                      ("entropy", EntropyKMeansClustering)):
+        for k in k_values:
+            for init in SEEDING_METHODS:
+                model = cls(k=k, init=init)
+                if cls is not KMenasClustering:
+                    model.set_weights(capacitances)
+                labels, elapsed = timed(model.fit, points)
+                score = inertia(points, model.centroids, labels, _model_weights(model))
+                print(f"{name:>10} {k:>4} {init:>10} {model.n_iterations:>11} {elapsed:>9.3f} {score:>14.6g}")
+
+
+def benchmark_metrics(points, capacitances, k_values, repeats=5):
+    """Distance kernel throughput per metric, then weighted fits in each metric scored in all of them
+
+    The L1 column is the total weighted rectilinear distance from the sinks to their centroids,
+    the wirelength the clustering is meant to reduce.
+    """
+    centroids = points[:max(k_values)]
+    print(f"{'metric':>12} {'kernel (Mpairs/s)':>18}")
+    for metric in METRICS:
+        _, elapsed = timed(lambda: [distance_matrix(points, centroids, metric) for _ in range(repeats)])
+        print(f"{metric:>12} {points.shape[0] * centroids.shape[0] * repeats / elapsed / 1e6:>18.1f}")
+
+    print()
+    print(f"{'metric':>12} {'K':>4} {'iterations':>11} {'time (s)':>9} {'L1':>12} {'L2':>12} {'squared L2':>12}")
+    for k in k_values:
+        for metric in METRICS:
+            model = WeightedKMeansClustering(k=k, init='k-means++', metric=metric)
+            model.set_weights(capacitances)
+            labels, elapsed = timed(model.fit, points)
+            scores = [inertia(points, model.centroids, labels, model.weights, metric=score_metric)
+                      for score_metric in ('manhattan', 'euclidean', 'sqeuclidean')]
+            print(f"{metric:>12} {k:>4} {model.n_iterations:>11} {elapsed:>9.3f} "
+                  + " ".join(f"{score:>12.6g}" for score in scores))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="K-means performance benchmarks")
+    parser.add_argument("suite", nargs="?", default="assignment", choices=["assignment", "minibatch", "seeding", "metrics"],
+                        help="assignment: vectorized fit vs the per-point loop; minibatch: mini-batch vs full batch; "
+                             "seeding: uniform vs k-means++ vs k-means|| initialization; "
+                             "metrics: L1 vs L2 vs squared L2 kernels and fits")
+    parser.add_argument("--repeat", type=int, default=1, help="Tile input/data.txt this many times")
+    parser.add_argument("-k", type=int, nargs="+", default=[3, 8, 20], help="K values to benchmark")
+    parser.add_argument("--batch-size", type=int, default=1024, help="Mini-batch size")
+    args = parser.parse_args()
+
+    points, capacitances = load_sinks(args.repeat)
+    print(f"Benchmarking on {points.shape[0]} points")
+    if args.suite == "assignment":
+        benchmark_assignment(points, args.k)
+    elif args.suite == "minibatch":
+        benchmark_minibatch(points, capacitances, args.k, args.batch_size)
+    elif args.suite == "seeding":
+        benchmark_seeding(points, capacitances, args.k)
+    else:
+        benchmark_metrics(points, capacitances, args.k)
+
+
+if __name__ == "__main__":
+    main()
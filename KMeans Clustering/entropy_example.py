@@ -1,29 +1,6 @@
 import numpy as np
-from scipy.spatial.distance import cdist
 import matplotlib.pyplot as plt
-
-def calculate_entropy(data_points, neighborhood_size=5):
-    """Calculate entropy for each point based on its neighborhood"""
-    n_points = data_points.shape[0]
-    entropies = np.zeros(n_points)
-    
-    # Calculate pairwise distances
-    distances = cdist(data_points, data_points)
-    
-    for i in range(n_points):
-        # Get k-nearest neighbors
-        neighbor_indices = np.argsort(distances[i])[1:neighborhood_size+1]  # Exclude self
-        neighbor_distances = distances[i][neighbor_indices]
-        
-        # Calculate probabilities based on distances using softmax
-        exp_distances = np.exp(-neighbor_distances)
-        probabilities = exp_distances / np.sum(exp_distances)
-        
-        # Calculate Shannon entropy
-        entropy = -np.sum(probabilities * np.log(probabilities + 1e-10))
-        entropies[i] = entropy
-        
-    return entropies
+from EntropyKMeansClustering import calculate_entropy
 
 def plot_entropy_example():
     # Create example data points